@@ -0,0 +1,192 @@
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from organisms.evolving_organism import EvolvingOrganism
+from food import Food
+from entity import Entity
+from config import SimulationConfig
+import constants
+
+# value of the type grid for cells that contain nothing
+EMPTY_ID = -1
+
+# per organism attribute arrays, maps name to (dtype, shape of a single organism's value)
+ORGANISM_FIELDS: Dict[str, Tuple[type, Tuple[int, ...]]] = {
+    'x': (np.int32, ()),
+    'y': (np.int32, ()),
+    'food_count': (np.float64, ()),
+    'age': (np.int32, ()),
+    'sight': (np.int32, ()),
+    'speed': (np.int32, ()),
+    'size': (np.int32, ()),
+    'is_aggressive': (np.bool_, ()),
+    'color': (np.uint8, (3,)),
+}
+
+
+# stores a habitat of EvolvingOrganism and Food as arrays instead of objects. organisms are kept in the first
+# population rows of the attribute arrays, food is a boolean grid since it has no state beyond its position.
+# every update touches only the organisms or cells involved, so the cost of a turn scales with the number of
+# live entities rather than with the area of the habitat. the grids are height rows of width cells, height defaults to
+# width
+class ArrayHabitat:
+    def __init__(self, width: int, capacity: int = 1024, height: Optional[int] = None) -> None:
+        self.width: int = width
+        self.height: int = width if height is None else height
+        self.population: int = 0
+        self.food_total: int = 0
+        self.food_grid: np.ndarray = np.zeros((self.height, width), dtype=np.bool_)
+        # number of organisms in each cell, and the index of one of them (or -1) for looking up visible colors
+        self.organism_grid: np.ndarray = np.zeros((self.height, width), dtype=np.int32)
+        self.cell_organism: np.ndarray = np.full((self.height, width), -1, dtype=np.int32)
+        self.__arrays: Dict[str, np.ndarray] = {
+            name: np.zeros((capacity,) + shape, dtype=dtype) for name, (dtype, shape) in ORGANISM_FIELDS.items()
+        }
+
+    # attribute arrays are exposed as views of the live organisms, e.g. habitat.food_count
+    def __getattr__(self, name: str) -> np.ndarray:
+        if name in ORGANISM_FIELDS:
+            return self.__arrays[name][:self.population]
+        raise AttributeError(name)
+
+    # so that augmented assignments like habitat.age += 1 write back into the arrays
+    def __setattr__(self, name: str, value) -> None:
+        if name in ORGANISM_FIELDS:
+            self.__arrays[name][:self.population] = value
+        else:
+            super().__setattr__(name, value)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.__arrays['x'])
+
+    @property
+    def occupancy(self) -> np.ndarray:
+        return self.organism_grid + self.food_grid
+
+    @property
+    def type_grid(self) -> np.ndarray:
+        type_grid = np.full((self.height, self.width), EMPTY_ID, dtype=np.int8)
+        type_grid[self.food_grid] = constants.FOOD_ID
+        type_grid[self.organism_grid > 0] = constants.ORGANISM_ID
+        return type_grid
+
+    def is_occupied(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return self.food_grid[y, x] | (self.organism_grid[y, x] > 0)
+
+    # color of the entity that would be drawn at each given cell, organisms are drawn over food
+    def get_visible_colors(self, x: np.ndarray, y: np.ndarray, default_color: Tuple[int, int, int] = (0, 0, 0)) -> np.ndarray:
+        colors = np.empty((len(x), 3), dtype=np.uint8)
+        colors[:] = default_color
+        colors[self.food_grid[y, x]] = constants.GREEN
+        organisms = self.cell_organism[y, x]
+        has_organism = organisms >= 0
+        colors[has_organism] = self.color[organisms[has_organism]]
+        return colors
+
+    def get_color_grid(self, default_color: Tuple[int, int, int] = (0, 0, 0)) -> np.ndarray:
+        grid = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        grid[:] = default_color
+        grid[self.food_grid] = constants.GREEN
+        grid[self.y, self.x] = self.color
+        return grid
+
+    def add_food(self, x: np.ndarray, y: np.ndarray) -> None:
+        self.food_total += len(x) - int(np.count_nonzero(self.food_grid[y, x]))
+        self.food_grid[y, x] = True
+
+    def remove_food(self, x: np.ndarray, y: np.ndarray) -> None:
+        self.food_total -= int(np.count_nonzero(self.food_grid[y, x]))
+        self.food_grid[y, x] = False
+
+    # appends organisms, fields that are not given get the defaults of a new EvolvingOrganism. the food they start with
+    # comes from the config of the simulation, so it has to be given
+    def add_organisms(self, x: np.ndarray, y: np.ndarray, food_count: np.ndarray, **fields: np.ndarray) -> None:
+        count = len(x)
+        start = self.population
+        self.__reserve(start + count)
+        fields['x'] = x
+        fields['y'] = y
+        fields['food_count'] = food_count
+        fields.setdefault('age', 0)
+        for name in ('sight', 'speed', 'size'):
+            fields.setdefault(name, 1)
+        fields.setdefault('is_aggressive', False)
+        fields.setdefault('color', (127, 127, 127))
+        for name, values in fields.items():
+            self.__arrays[name][start:start + count] = values
+        self.population += count
+        np.add.at(self.organism_grid, (y, x), 1)
+        self.cell_organism[y, x] = np.arange(start, start + count, dtype=np.int32)
+
+    # moves every live organism to the given position
+    def move_organisms(self, new_x: np.ndarray, new_y: np.ndarray) -> None:
+        old_x, old_y = self.x.copy(), self.y.copy()
+        np.subtract.at(self.organism_grid, (old_y, old_x), 1)
+        self.cell_organism[old_y, old_x] = -1
+        self.x[:] = new_x
+        self.y[:] = new_y
+        np.add.at(self.organism_grid, (new_y, new_x), 1)
+        self.__index_cells()
+
+    # removes every organism where keep is false, keeping the survivors in their current order
+    def remove_organisms(self, keep: np.ndarray) -> None:
+        dead = ~keep
+        dead_x, dead_y = self.x[dead], self.y[dead]
+        np.subtract.at(self.organism_grid, (dead_y, dead_x), 1)
+        self.cell_organism[dead_y, dead_x] = -1
+        survivors = int(np.count_nonzero(keep))
+        for name in ORGANISM_FIELDS:
+            array = self.__arrays[name]
+            array[:survivors] = array[:self.population][keep]
+        self.population = survivors
+        self.__index_cells()
+
+    # puts the live organisms in the given order, a permutation of their indices
+    def reorder_organisms(self, order: np.ndarray) -> None:
+        for name in ORGANISM_FIELDS:
+            array = self.__arrays[name]
+            array[:self.population] = array[:self.population][order]
+        self.__index_cells()
+
+    def __index_cells(self) -> None:
+        self.cell_organism[self.y, self.x] = np.arange(self.population, dtype=np.int32)
+
+    def __reserve(self, capacity: int) -> None:
+        if capacity <= self.capacity:
+            return
+        new_capacity = max(capacity, 2 * self.capacity)
+        for name, array in self.__arrays.items():
+            grown = np.zeros((new_capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:self.population] = array[:self.population]
+            self.__arrays[name] = grown
+
+    # organisms know their birth turn instead of their age, turn is the turn their ages are taken at
+    @classmethod
+    def from_entities(cls, width: int, entities: List[Entity], turn: int = 0) -> 'ArrayHabitat':
+        organisms = [e for e in entities if isinstance(e, EvolvingOrganism)]
+        ages = {'age': [o.get_age(turn) for o in organisms]}
+        food = [e for e in entities if isinstance(e, Food)]
+        habitat = cls(width, max(len(organisms), 1))
+        habitat.add_food(np.array([f.x for f in food], dtype=np.int32), np.array([f.y for f in food], dtype=np.int32))
+        habitat.add_organisms(
+            np.array([o.x for o in organisms], dtype=np.int32),
+            np.array([o.y for o in organisms], dtype=np.int32),
+            **{name: np.array(ages[name] if name in ages else [getattr(o, name) for o in organisms],
+                              dtype=dtype).reshape((-1,) + shape)
+               for name, (dtype, shape) in ORGANISM_FIELDS.items() if name not in ('x', 'y')})
+        return habitat
+
+    def to_entities(self, config: SimulationConfig, turn: int = 0) -> List[Entity]:
+        food_y, food_x = np.nonzero(self.food_grid)
+        entities: List[Entity] = [Food(int(x), int(y)) for x, y in zip(food_x, food_y)]
+        for i in range(self.population):
+            organism = EvolvingOrganism(int(self.x[i]), int(self.y[i]), sight=int(self.sight[i]),
+                                        speed=int(self.speed[i]), size=int(self.size[i]),
+                                        is_aggressive=bool(self.is_aggressive[i]),
+                                        color=tuple(int(c) for c in self.color[i]), config=config)
+            organism.food_count = float(self.food_count[i])
+            organism.birth_turn = turn - int(self.age[i])
+            entities.append(organism)
+        return entities
@@ -0,0 +1,431 @@
+from typing import Callable, Dict, List, Tuple, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from array_habitat import ArrayHabitat
+from direction import Direction
+from entity import Entity
+from config import SimulationConfig, DEFAULT_CONFIG
+from metrics import MetricsRecorder
+from instrumentation import Instrumentation
+import constants
+
+if TYPE_CHECKING:
+    from checkpoint import Checkpointer
+    from frame_export import FrameExporter
+    from render_pipeline import SimulationRenderer
+
+DIRECTIONS: List[Direction] = list(Direction)
+# delta_x, delta_y of each direction, rows are in the same order as DIRECTIONS
+DELTAS: np.ndarray = np.array([direction.value for direction in DIRECTIONS], dtype=np.int32)
+MAX_COLOR_DISTANCE: float = np.sqrt((255 ** 2) * 3)
+
+
+# looks in every direction from each (x, y) until an occupied cell or the border is found, but no further than
+# limit cells. returns the distance, the color of what was seen and whether anything was seen (the border is not
+# seen) for each position and direction. when nothing is found within limit the distance is limit + 1. top, if given,
+# is the first row of the habitat.width rows each position can see, for habitats that stack several habitats
+def get_sight(habitat: ArrayHabitat, x: np.ndarray, y: np.ndarray, limit: np.ndarray,
+              top: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    count = len(x)
+    top = np.zeros(count, dtype=np.int32) if top is None else top
+    distances = np.repeat(limit[:, np.newaxis] + 1, len(DIRECTIONS), axis=1)
+    colors = np.zeros((count, len(DIRECTIONS), 3), dtype=np.uint8)
+    seen = np.zeros((count, len(DIRECTIONS)), dtype=np.bool_)
+    for d, (delta_x, delta_y) in enumerate(DELTAS):
+        searching = np.arange(count)
+        distance = 0
+        while len(searching) > 0:
+            distance += 1
+            searching = searching[limit[searching] >= distance]
+            look_x = x[searching] + delta_x * distance
+            look_y = y[searching] + delta_y * distance
+            look_top = top[searching]
+            in_bounds = (0 <= look_x) & (look_x < habitat.width) & (look_top <= look_y) & (look_y < look_top + habitat.width)
+            distances[searching[~in_bounds], d] = distance
+            searching, look_x, look_y = searching[in_bounds], look_x[in_bounds], look_y[in_bounds]
+            occupied = habitat.is_occupied(look_x, look_y)
+            found = searching[occupied]
+            distances[found, d] = distance
+            colors[found, d] = habitat.get_visible_colors(look_x[occupied], look_y[occupied])
+            seen[found, d] = True
+            searching = searching[~occupied]
+    return distances, colors, seen
+
+
+# vectorized phenotype_cache.ScoreTable.get_score for every organism and direction, directions with nothing seen score 0
+def get_scores(distances: np.ndarray, colors: np.ndarray, seen: np.ndarray, sight: np.ndarray,
+               is_aggressive: np.ndarray) -> np.ndarray:
+    color_distance = np.sqrt(((colors.astype(np.float64) - constants.GREEN) ** 2).sum(axis=2))
+    color_score = color_distance / MAX_COLOR_DISTANCE
+    color_score = np.where(is_aggressive[:, np.newaxis], color_score, color_score * -1 + 1)
+    sight = sight[:, np.newaxis]
+    distance_score = ((distances - 1) / np.maximum(sight - 1, 1) * -1) + 1
+    distance_score = np.where(distances > sight, 0, distance_score)
+    return np.where(seen, color_score + distance_score, 0)
+
+
+# picks a direction for each organism the same way EvolvingOrganism.get_moves does: directions are visited in a
+# random order and the first one with the highest positive score within sight wins. returns the index of the chosen
+# direction, or -1 if there is none, and the number of moves, which is limited by the closest thing in any direction
+def choose_directions(distances: np.ndarray, scores: np.ndarray, sight: np.ndarray, speed: np.ndarray,
+                      rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    return choose_directions_by_keys(distances, scores, sight, speed, rng.random(scores.shape))
+
+
+# choose_directions with the random order of the directions given as keys, one random number per organism and
+# direction, so that the numbers can be drawn somewhere else than where the directions are chosen
+def choose_directions_by_keys(distances: np.ndarray, scores: np.ndarray, sight: np.ndarray, speed: np.ndarray,
+                              keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(keys, axis=1)
+    shuffled_scores = np.take_along_axis(scores, order, axis=1)
+    shuffled_distances = np.take_along_axis(distances, order, axis=1)
+    candidates = (shuffled_distances <= sight[:, np.newaxis]) & (shuffled_scores > 0)
+    shuffled_scores = np.where(candidates, shuffled_scores, -np.inf)
+    best = np.argmax(shuffled_scores, axis=1)
+    has_direction = candidates.any(axis=1)
+    directions = np.where(has_direction, order[np.arange(len(order)), best], -1)
+    move_counts = np.where(has_direction, np.minimum(speed, distances.min(axis=1)), 0)
+    return directions, move_counts
+
+
+# see instrumentation.get_scanned_cell_count
+def get_scanned_cell_count(distances: np.ndarray, seen: np.ndarray) -> int:
+    return int(np.where(seen, distances, distances - 1).sum())
+
+
+# every attempted step costs food, and an organism stops moving once its food runs out. takes the food of the moves
+# from food_count in place and returns the number of steps each organism takes
+def take_steps(food_count: np.ndarray, move_counts: np.ndarray, move_cost: np.ndarray) -> np.ndarray:
+    steps_taken = np.zeros(len(food_count), dtype=np.int32)
+    for step in range(int(move_counts.max(initial=0))):
+        stepping = move_counts > step
+        food_count[stepping] -= move_cost[stepping]
+        steps_taken += stepping & (food_count > 0)
+    return steps_taken
+
+
+# the organisms of the habitat that share their cell with another organism or with food
+def get_contested(habitat: ArrayHabitat) -> np.ndarray:
+    h = habitat
+    return np.flatnonzero((h.organism_grid[h.y, h.x] > 1) | h.food_grid[h.y, h.x])
+
+
+# in each cell of the contested organisms the largest organism eats every smaller organism and all the food, as the
+# pairwise EvolvingOrganism.collide and Food.collide rules work out to. organisms of the largest size do not eat each
+# other. contested must hold every organism of those cells. returns the number of entities eaten and the organisms that
+# are kept, which were removed from the habitat
+def resolve_collisions(habitat: ArrayHabitat, contested: np.ndarray) -> Tuple[int, np.ndarray]:
+    h = habitat
+    keep = np.ones(h.population, dtype=np.bool_)
+    if len(contested) == 0:
+        return 0, keep
+    on_food = h.food_grid[h.y, h.x]
+    cells = h.y[contested] * h.width + h.x[contested]
+    order = contested[np.lexsort((contested, -h.size[contested], cells))]
+    cells = h.y[order] * h.width + h.x[order]
+    is_first = np.r_[True, cells[1:] != cells[:-1]]
+    group = np.cumsum(is_first) - 1
+    winners = order[is_first]
+    is_eaten = h.size[order] < h.size[winners][group]
+    gains = np.bincount(group, weights=np.where(is_eaten, h.food_count[order], 0), minlength=len(winners))
+    h.food_count[winners] += gains + on_food[winners]
+    h.remove_food(h.x[winners], h.y[winners])
+    keep[order[is_eaten]] = False
+    h.remove_organisms(keep)
+    return int(np.count_nonzero(is_eaten) + np.count_nonzero(on_food[winners])), keep
+
+
+# ages the given organisms, or all of them, by a turn and removes those that die of old age or starvation. returns the
+# organisms that are kept
+def age_organisms(habitat: ArrayHabitat, max_age: int, organisms: Optional[np.ndarray] = None) -> np.ndarray:
+    h = habitat
+    selected = slice(None) if organisms is None else organisms
+    h.age[selected] += 1
+    keep = np.ones(h.population, dtype=np.bool_)
+    keep[selected] = (h.age[selected] < max_age) & (h.food_count[selected] > 0)
+    h.remove_organisms(keep)
+    return keep
+
+
+# the random values a reproducing organism needs, in the order they are drawn: a key per direction, the steps of
+# sight, speed and size, the steps of the color channels and the roll for flipping aggressiveness
+def get_reproduction_draws(rng: np.random.Generator, count: int) -> np.ndarray:
+    return np.hstack((rng.random((count, len(DIRECTIONS))), rng.choice(np.array([-1, 1]), size=(count, 3)),
+                      rng.choice(np.array([-10, 10]), size=(count, 3)), rng.random(count)[:, np.newaxis]))
+
+
+# gives each parent an offspring in a random direction that stays inside the habitat, with the mutations of its draws
+# (see get_reproduction_draws). top is the first row of the habitat.width rows each parent lives in, and offspring are
+# only born in the rows of the habitat's grids
+def add_offspring(habitat: ArrayHabitat, parents: np.ndarray, draws: np.ndarray, top: np.ndarray,
+                  config: SimulationConfig) -> None:
+    h = habitat
+    targets_x = h.x[parents, np.newaxis] + DELTAS[:, 0]
+    targets_y = h.y[parents, np.newaxis] + DELTAS[:, 1]
+    bottom = np.minimum(top[:, np.newaxis] + h.width, h.height)
+    top = np.maximum(top[:, np.newaxis], 0)
+    in_bounds = (0 <= targets_x) & (targets_x < h.width) & (top <= targets_y) & (targets_y < bottom)
+    directions = np.argmax(np.where(in_bounds, draws[:, :len(DIRECTIONS)], -1), axis=1)
+    rows = np.arange(len(parents))
+    h.food_count[parents] = config.start_food
+    steps = draws[:, 4:7].astype(np.int64)
+    color_steps = draws[:, 7:10].astype(np.int64)
+    flips = draws[:, 10] >= 0.9
+    h.add_organisms(
+        targets_x[rows, directions], targets_y[rows, directions],
+        food_count=config.start_food,
+        sight=np.maximum(h.sight[parents] + steps[:, 0], 0),
+        speed=np.maximum(h.speed[parents] + steps[:, 1], 0),
+        size=np.maximum(h.size[parents] + steps[:, 2], 1),
+        is_aggressive=h.is_aggressive[parents] ^ flips,
+        color=np.clip(h.color[parents].astype(np.int16) + color_steps, 0, 255))
+
+
+# random empty cells of a habitat made of food_grid, organism_grid and the organisms at x, y, each picked with the
+# adjusted spawn probability, or sampled, depending on spawn_mode
+def get_spawn_positions(spawn_mode: str, spawn_probability: float, food_grid: np.ndarray, organism_grid: np.ndarray,
+                        x: np.ndarray, y: np.ndarray, food_total: int,
+                        rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    if spawn_mode == 'sampled':
+        return get_sampled_spawn_positions(spawn_probability, food_grid, organism_grid, x, y, food_total, rng)
+    if spawn_mode != 'per_cell':
+        raise ValueError(f'unknown spawn mode: {spawn_mode}')
+    is_empty = ~food_grid & (organism_grid == 0)
+    probability = get_adjusted_spawn_probability(spawn_probability, len(x) + food_total, food_grid.size)
+    spawn_y, spawn_x = np.nonzero(is_empty & (rng.random(is_empty.shape) < probability))
+    return spawn_x.astype(np.int32), spawn_y.astype(np.int32)
+
+
+# see EvolutionSimulation.get_sampled_spawn_positions. empty cells are found by drawing random cells and keeping
+# the empty ones until there are enough, unless most of the habitat is occupied. the grids need not be square
+def get_sampled_spawn_positions(spawn_probability: float, food_grid: np.ndarray, organism_grid: np.ndarray,
+                                x: np.ndarray, y: np.ndarray, food_total: int,
+                                rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray]:
+    width = food_grid.shape[1]
+    cell_count = food_grid.size
+    organism_cells = np.unique(y.astype(np.int64) * width + x)
+    shared_cells = int(np.count_nonzero(food_grid.reshape(-1)[organism_cells]))
+    empty_count = cell_count - food_total - len(organism_cells) + shared_cells
+    if empty_count == 0:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+    count = int(rng.binomial(empty_count, min(spawn_probability * cell_count / empty_count, 1)))
+    if 2 * empty_count < cell_count:
+        is_empty = ~food_grid & (organism_grid == 0)
+        cells = rng.choice(np.flatnonzero(is_empty), size=count, replace=False)
+    else:
+        cells = np.empty(0, dtype=np.int64)
+        while len(cells) < count:
+            candidates = rng.integers(0, cell_count, size=2 * (count - len(cells)))
+            candidates = candidates[~food_grid.reshape(-1)[candidates] & (organism_grid.reshape(-1)[candidates] == 0)]
+            cells = np.concatenate((cells, candidates))
+            # keeps the first draw of every cell, in the order drawn
+            _, first = np.unique(cells, return_index=True)
+            cells = cells[np.sort(first)]
+        cells = cells[:count]
+    return (cells % width).astype(np.int32), (cells // width).astype(np.int32)
+
+
+# see EvolutionSimulation.get_adjusted_spawn_probability
+def get_adjusted_spawn_probability(spawn_probability: float, entity_count: int, total_spaces: int) -> float:
+    spaces_available = total_spaces - entity_count
+    if spaces_available <= 0:
+        return 0
+    ratio = total_spaces / spaces_available
+    return min(spawn_probability * ratio, 1)
+
+
+# steps an EvolvingOrganism population a whole turn at a time with array operations instead of one object at a time.
+# it follows the rules of EvolutionSimulation, except that all organisms decide their moves from the habitat as it
+# was at the start of the turn, instead of seeing the organisms that moved before them
+class BatchedEvolutionSimulation:
+    # headless simulations never import pygame, render_interval is how many turns pass between rendered frames.
+    # every random decision is drawn from rng, so a given seed always produces the same sequence of turns.
+    # metrics_recorder, if given, receives the population metrics of the turns it samples, and checkpointer, if given,
+    # saves the state of the simulation as turns pass. instrumentation, if given, measures every turn, and
+    # frame_exporter, if given, records turns as frames without needing a window. habitat, if given, is the habitat the
+    # simulation starts from instead of spawning its first organisms and food
+    def __init__(self, config: SimulationConfig = DEFAULT_CONFIG, headless: bool = False, render_interval: int = 1,
+                 seed: Optional[int] = None, metrics_recorder: Optional[MetricsRecorder] = None,
+                 checkpointer: Optional['Checkpointer'] = None, instrumentation: Optional[Instrumentation] = None,
+                 frame_exporter: Optional['FrameExporter'] = None, habitat: Optional[ArrayHabitat] = None) -> None:
+        self.config: SimulationConfig = config
+        self.habitat_width: int = config.habitat_width
+        self.turn: int = 0
+        self.render_interval: int = render_interval
+        self.rng: np.random.Generator = np.random.default_rng(seed)
+        self.metrics_recorder: Optional[MetricsRecorder] = metrics_recorder
+        self.checkpointer: Optional['Checkpointer'] = checkpointer
+        self.instrumentation: Optional[Instrumentation] = instrumentation
+        self.frame_exporter: Optional['FrameExporter'] = frame_exporter
+        # colors of the last rendered frame, for finding the cells that changed since then
+        self.rendered_colors: Optional[np.ndarray] = None
+        self.habitat: ArrayHabitat = self.get_empty_habitat() if habitat is None else habitat
+        self.renderer: Optional['SimulationRenderer'] = None if headless else self.get_renderer()
+        if habitat is None:
+            self.spawn_organisms()
+            self.spawn_food(self.config.initial_food_spawn_probability)
+
+    def get_renderer(self) -> 'SimulationRenderer':
+        # imported here so that pygame is only loaded when a window is actually needed
+        from render_pipeline import get_renderer
+        return get_renderer(self.config, self.habitat_width)
+
+    def get_empty_habitat(self) -> ArrayHabitat:
+        return ArrayHabitat(self.habitat_width)
+
+    # random values for the given organisms, drawn with method(rng, count), which returns a row per organism
+    def draw(self, organisms: np.ndarray, method: Callable[[np.random.Generator, int], np.ndarray]) -> np.ndarray:
+        return method(self.rng, len(organisms))
+
+    # runs forever if turns is None, otherwise returns after the given number of turns
+    def run(self, turns: Optional[int] = None) -> None:
+        if turns is None:
+            while True:
+                self.step()
+        for _ in range(turns):
+            self.step()
+
+    def step(self) -> None:
+        if self.should_render():
+            self.render()
+        if self.frame_exporter is not None:
+            self.frame_exporter.on_turn(self)
+        self.do_one_turn()
+        self.turn += 1
+        if self.checkpointer is not None:
+            self.checkpointer.on_turn(self)
+
+    def should_render(self) -> bool:
+        return self.renderer is not None and self.turn % self.render_interval == 0
+
+    # draws only the cells that changed since the last frame, or the whole habitat if too many of them changed
+    def render(self) -> None:
+        colors = self.habitat.get_color_grid()
+        changed = None if self.rendered_colors is None else np.any(colors != self.rendered_colors, axis=2)
+        if changed is None or self.renderer.should_render_fully(int(np.count_nonzero(changed))):
+            self.renderer.render_array(colors)
+        else:
+            changed_y, changed_x = np.nonzero(changed)
+            self.renderer.render_cells({(x, y): tuple(colors[y, x]) for x, y in zip(changed_x.tolist(), changed_y.tolist())})
+        self.rendered_colors = colors
+
+    def do_one_turn(self) -> None:
+        if self.instrumentation is not None:
+            self.do_one_turn_instrumented()
+            return
+        self.move_organisms()
+        self.do_collisions()
+        self.check_if_present()
+        self.spawn_food(self.config.food_spawn_probability)
+        self.do_reproductions()
+        self.record_metrics()
+
+    # do_one_turn with every phase timed
+    def do_one_turn_instrumented(self) -> None:
+        instrumentation = self.instrumentation
+        instrumentation.start_turn(self.turn)
+        instrumentation.run_phase('move_organisms', self.move_organisms)
+        instrumentation.run_phase('do_collisions', self.do_collisions)
+        instrumentation.run_phase('check_if_present', self.check_if_present)
+        instrumentation.run_phase('spawn_food', self.spawn_food, self.config.food_spawn_probability)
+        instrumentation.run_phase('do_reproductions', self.do_reproductions)
+        instrumentation.run_phase('record_metrics', self.record_metrics)
+        instrumentation.end_turn()
+
+    def record_metrics(self) -> None:
+        if self.metrics_recorder is not None and self.metrics_recorder.should_record(self.turn):
+            self.metrics_recorder.record(self.turn, self.get_metric_values())
+
+    # computed from the attribute arrays only on the turns that are sampled, over the given organisms or all of them
+    def get_metric_values(self, organisms: Optional[np.ndarray] = None) -> Dict[str, Optional[float]]:
+        h = self.habitat
+        selected = slice(None) if organisms is None else organisms
+        count = h.population if organisms is None else len(organisms)
+        total_aggressive = int(np.count_nonzero(h.is_aggressive[selected]))
+        return {
+            'population': count,
+            'average_speed': float(h.speed[selected].mean()) if count else None,
+            'average_sight': float(h.sight[selected].mean()) if count else None,
+            'average_size': float(h.size[selected].mean()) if count else None,
+            'average_red': float(h.color[selected, 0].mean()) if count else None,
+            'average_green': float(h.color[selected, 1].mean()) if count else None,
+            'average_blue': float(h.color[selected, 2].mean()) if count else None,
+            'total_aggressive': total_aggressive,
+            'total_non_aggressive': count - total_aggressive,
+        }
+
+    def move_organisms(self) -> None:
+        h = self.habitat
+        if h.population == 0:
+            return
+        h.food_count -= self.config.cost_to_live * h.sight
+        h.food_count -= self.config.cost_to_live * h.size
+        if self.instrumentation is not None:
+            self.instrumentation.count('entities_visited', h.population)
+        is_moving = self.draw(np.arange(h.population), lambda rng, count: rng.random(count)) >= h.age / self.config.max_age
+        directions, move_counts = self.choose_directions()
+        move_counts[~is_moving] = 0
+        steps_taken = take_steps(h.food_count, move_counts, self.config.move_cost * h.size)
+        deltas = DELTAS[np.maximum(directions, 0)] * steps_taken[:, np.newaxis]
+        h.move_organisms(h.x + deltas[:, 0], h.y + deltas[:, 1])
+
+    # the direction and number of moves of every organism, see choose_directions
+    def choose_directions(self) -> Tuple[np.ndarray, np.ndarray]:
+        h = self.habitat
+        limit = np.maximum(h.sight, h.speed)
+        distances, colors, seen = get_sight(h, h.x, h.y, limit, self.get_top_rows(np.arange(h.population)))
+        scores = get_scores(distances, colors, seen, h.sight, h.is_aggressive)
+        if self.instrumentation is not None:
+            self.instrumentation.count('sight_cells_scanned', get_scanned_cell_count(distances, seen))
+        keys = self.draw(np.arange(h.population), lambda rng, count: rng.random((count, len(DIRECTIONS))))
+        return choose_directions_by_keys(distances, scores, h.sight, h.speed, keys)
+
+    # see resolve_collisions
+    def do_collisions(self) -> None:
+        eaten_count, keep = resolve_collisions(self.habitat, get_contested(self.habitat))
+        if self.instrumentation is not None and eaten_count > 0:
+            self.instrumentation.count('collisions', eaten_count)
+            self.instrumentation.count('deaths', len(keep) - int(np.count_nonzero(keep)))
+
+    def check_if_present(self) -> None:
+        keep = age_organisms(self.habitat, self.config.max_age)
+        if self.instrumentation is not None:
+            self.instrumentation.count('deaths', len(keep) - int(np.count_nonzero(keep)))
+
+    def do_reproductions(self) -> None:
+        h = self.habitat
+        parents = np.flatnonzero(h.food_count > self.config.reproduction_cost)
+        count = len(parents)
+        if count == 0:
+            return
+        if self.instrumentation is not None:
+            self.instrumentation.count('births', count)
+        add_offspring(h, parents, self.draw(parents, get_reproduction_draws), self.get_top_rows(parents), self.config)
+
+    def spawn_food(self, spawn_probability: float) -> None:
+        x, y = self.get_spawn_positions(spawn_probability)
+        self.habitat.add_food(x, y)
+
+    def spawn_organisms(self) -> None:
+        x, y = self.get_spawn_positions(self.config.organism_spawn_probability)
+        self.habitat.add_organisms(x, y, food_count=self.config.start_food)
+
+    def get_spawn_positions(self, spawn_probability: float) -> Tuple[np.ndarray, np.ndarray]:
+        h = self.habitat
+        return get_spawn_positions(self.config.spawn_mode, spawn_probability, h.food_grid, h.organism_grid, h.x, h.y,
+                                   h.food_total, self.rng)
+
+    # the first row of the habitat each of the given organisms lives in
+    def get_top_rows(self, organisms: np.ndarray) -> np.ndarray:
+        return np.zeros(len(organisms), dtype=np.int32)
+
+    def get_entities(self) -> List[Entity]:
+        return self.habitat.to_entities(self.config, self.turn)
+
+    def get_board_for_renderer(self, default_color: Tuple[int, int, int] = (0, 0, 0)) -> List[List[Tuple[int, int, int]]]:
+        return self.habitat.get_color_grid(default_color).tolist()
+
+    # same as get_board_for_renderer, as a habitat_width x habitat_width x 3 array
+    def get_color_array(self, default_color: Tuple[int, int, int] = (0, 0, 0)) -> np.ndarray:
+        return self.habitat.get_color_grid(default_color)
@@ -0,0 +1,178 @@
+import argparse
+import itertools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+from evolution_simulation import EvolutionSimulation
+from simulation import Simulation
+from batched_evolution_simulation import BatchedEvolutionSimulation
+from tiled_evolution_simulation import TiledEvolutionSimulation
+from config import SimulationConfig
+from metrics import MetricsRecorder, MetricsSink
+from instrumentation import Instrumentation
+import constants
+
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+WIDTHS: Dict[str, int] = {'small': 100, 'large': 300}
+# initial_food_spawn_probability and organism_spawn_probability of each density
+DENSITIES: Dict[str, Dict[str, float]] = {
+    'sparse': {'initial_food_spawn_probability': 0.05, 'organism_spawn_probability': 0.002},
+    'crowded': {'initial_food_spawn_probability': 0.5, 'organism_spawn_probability': 0.02},
+}
+
+
+# a headless, seeded simulation setup. aggressive is None for simulations that start from their own population
+class Scenario:
+    def __init__(self, name: str, simulation_class: type, config: SimulationConfig,
+                 aggressive: Optional[bool] = None, seed: int = 0) -> None:
+        self.name: str = name
+        self.simulation_class: type = simulation_class
+        self.config: SimulationConfig = config
+        self.aggressive: Optional[bool] = aggressive
+        self.seed: int = seed
+
+    def create(self, instrumentation: Optional[Instrumentation] = None):
+        if self.simulation_class is EvolutionSimulation:
+            simulation = EvolutionSimulation(self.config, headless=True, seed=self.seed,
+                                             metrics_recorder=MetricsRecorder([NullSink()]),
+                                             instrumentation=instrumentation)
+            set_aggressive(simulation, self.aggressive)
+            return simulation
+        return self.simulation_class(self.config, headless=True, seed=self.seed, instrumentation=instrumentation)
+
+
+# receives the metrics of every turn and drops them, so that collecting them is timed without any output
+class NullSink(MetricsSink):
+    def write(self, turn: int, values: Dict[str, Optional[float]]) -> None:
+        pass
+
+
+def set_aggressive(simulation: EvolutionSimulation, aggressive: bool) -> None:
+    for entity in simulation.entities:
+        if entity.mask_id == constants.ORGANISM_ID:
+            simulation.population_metrics.remove(entity)
+            entity.is_aggressive = aggressive
+            simulation.population_metrics.add(entity)
+
+
+# the simulation itself for simulations that have to be closed, see TiledEvolutionSimulation
+def get_closing_context(simulation):
+    return simulation if isinstance(simulation, TiledEvolutionSimulation) else nullcontext()
+
+
+def get_entity_count(simulation) -> int:
+    if isinstance(simulation, BatchedEvolutionSimulation):
+        return simulation.habitat.population + simulation.habitat.food_total
+    return len(simulation.entities)
+
+
+# every combination of width and density for Simulation and the array simulations, and additionally of aggressive and
+# passive populations for EvolutionSimulation
+def get_scenarios() -> List[Scenario]:
+    scenarios = []
+    for (width_name, width), (density_name, density) in itertools.product(WIDTHS.items(), DENSITIES.items()):
+        config = SimulationConfig(habitat_width=width, **density)
+        for aggressive in (True, False):
+            population = 'aggressive' if aggressive else 'passive'
+            scenarios.append(Scenario(f'evolution-{width_name}-{density_name}-{population}', EvolutionSimulation,
+                                      config, aggressive))
+        scenarios.append(Scenario(f'simulation-{width_name}-{density_name}', Simulation, config))
+        scenarios.append(Scenario(f'batched-{width_name}-{density_name}', BatchedEvolutionSimulation, config))
+        scenarios.append(Scenario(f'tiled-{width_name}-{density_name}', TiledEvolutionSimulation, config))
+    return scenarios
+
+
+# times turns of the scenario, keeping the fastest of repeats runs, then runs it once more under tracemalloc for the
+# peak memory, since tracing slows the simulation down too much to time it at the same time
+def run_scenario(scenario: Scenario, turns: int, repeats: int = 3) -> Dict[str, Any]:
+    best: Optional[Dict[str, Any]] = None
+    for _ in range(repeats):
+        instrumentation = Instrumentation(window=turns)
+        simulation = scenario.create(instrumentation)
+        with get_closing_context(simulation):
+            start = time.perf_counter()
+            simulation.run(turns)
+            elapsed = time.perf_counter() - start
+            if best is None or elapsed < best['seconds']:
+                best = {'turns': turns, 'seconds': elapsed, 'turns_per_second': turns / elapsed,
+                        'phase_seconds': {phase: stats['mean']
+                                          for phase, stats in instrumentation.get_phase_stats().items()},
+                        'counts': {name: stats['mean'] for name, stats in instrumentation.get_counter_stats().items()},
+                        'entities': get_entity_count(simulation)}
+    tracemalloc.start()
+    simulation = scenario.create()
+    with get_closing_context(simulation):
+        simulation.run(turns)
+    best['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return best
+
+
+# the scenarios that got slower or used more memory than their baseline by more than tolerance. results of a
+# different number of turns than the baseline are not compared
+def get_regressions(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+                    tolerance: float) -> List[str]:
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None or expected['turns'] != result['turns']:
+            continue
+        if result['turns_per_second'] < expected['turns_per_second'] * (1 - tolerance):
+            regressions.append(f'{name}: {result["turns_per_second"]:.1f} turns/s, baseline '
+                               f'{expected["turns_per_second"]:.1f}')
+        if result['peak_memory_mb'] > expected['peak_memory_mb'] * (1 + tolerance):
+            regressions.append(f'{name}: {result["peak_memory_mb"]:.1f} MB peak, baseline '
+                               f'{expected["peak_memory_mb"]:.1f}')
+    return regressions
+
+
+def print_result(name: str, result: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    change = ''
+    if baseline is not None:
+        change = f' ({result["turns_per_second"] / baseline["turns_per_second"] - 1:+.0%})'
+    phases = ', '.join(f'{phase} {seconds * 1000:.2f}' for phase, seconds in result['phase_seconds'].items())
+    print(f'{name}: {result["turns_per_second"]:.1f} turns/s{change}, {result["peak_memory_mb"]:.1f} MB peak')
+    print(f'    ms per turn: {phases}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Time the turn pipeline of headless, seeded simulations.')
+    parser.add_argument('--turns', type=int, default=30)
+    parser.add_argument('--repeats', type=int, default=3, help='runs per scenario, the fastest one counts')
+    parser.add_argument('--scenarios', nargs='+', help='only run scenarios whose name contains one of these')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown or memory growth')
+    parser.add_argument('--update-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    args = parser.parse_args()
+    scenarios = [scenario for scenario in get_scenarios()
+                 if args.scenarios is None or any(part in scenario.name for part in args.scenarios)]
+    baseline: Dict[str, Dict[str, Any]] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+    results = {}
+    for scenario in scenarios:
+        results[scenario.name] = run_scenario(scenario, args.turns, args.repeats)
+        print_result(scenario.name, results[scenario.name], baseline.get(scenario.name))
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump({**baseline, **results}, file, indent=2)
+        return
+    regressions = get_regressions(results, baseline, args.tolerance)
+    if regressions:
+        print('regressions:')
+        for regression in regressions:
+            print(f'    {regression}')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import json
+import os
+from typing import Dict, Union
+
+import numpy as np
+
+from array_habitat import ArrayHabitat, ORGANISM_FIELDS
+from batched_evolution_simulation import BatchedEvolutionSimulation
+from evolution_simulation import EvolutionSimulation
+from tiled_evolution_simulation import TiledEvolutionSimulation
+from ensemble_evolution_simulation import EnsembleEvolutionSimulation
+from organisms.evolving_organism import EvolvingOrganism
+from entity_store import EntityStore
+from metrics import PopulationMetrics
+from config import SimulationConfig
+from food import Food
+import constants
+
+AnySimulation = Union[EvolutionSimulation, BatchedEvolutionSimulation]
+
+
+# a checkpoint is an .npz file of arrays, written under a temporary name and renamed when complete so that a crash
+# while saving never leaves a partial checkpoint behind. it holds everything needed to continue a run bit for bit:
+# the config, the turn, the RNG state and all entities. BatchedEvolutionSimulation checkpoints are the attribute arrays
+# of its ArrayHabitat and load without creating an object per entity
+def save_checkpoint(simulation: AnySimulation, path: str) -> None:
+    if isinstance(simulation, EnsembleEvolutionSimulation):
+        raise TypeError('cannot checkpoint an ensemble, checkpoint its replicas from get_replica instead')
+    if isinstance(simulation, BatchedEvolutionSimulation):
+        arrays = get_batched_state(simulation)
+    elif isinstance(simulation, EvolutionSimulation):
+        arrays = get_reference_state(simulation)
+    else:
+        raise TypeError(f'cannot checkpoint a {type(simulation).__name__}')
+    arrays['config'] = np.array(json.dumps(simulation.config.to_dict()))
+    arrays['turn'] = np.array(simulation.turn)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        np.savez_compressed(file, **arrays)
+    os.replace(temporary_path, path)
+
+
+# replaces the state of a running simulation with the one saved at path. the checkpoint must come from the same kind
+# of simulation
+def restore_checkpoint(simulation: AnySimulation, path: str) -> None:
+    # every access to an array of an .npz file reads and decompresses it again, so each is read once here
+    with np.load(path) as file:
+        data = {name: file[name] for name in file.files}
+    engine = str(data['engine'])
+    if engine != type(simulation).__name__:
+        raise ValueError(f'{path} is a checkpoint of a {engine}, not a {type(simulation).__name__}')
+    simulation.config = SimulationConfig.from_dict(json.loads(str(data['config'])))
+    simulation.habitat_width = simulation.config.habitat_width
+    simulation.turn = int(data['turn'])
+    if isinstance(simulation, BatchedEvolutionSimulation):
+        set_batched_state(simulation, data)
+    else:
+        set_reference_state(simulation, data)
+    if simulation.renderer is not None:
+        simulation.renderer.request_full_render()
+
+
+# creates a simulation of the kind that was saved at path and restores it, kwargs are passed to its constructor
+def load_checkpoint(path: str, **kwargs) -> AnySimulation:
+    with np.load(path) as data:
+        engine = str(data['engine'])
+        config = SimulationConfig.from_dict(json.loads(str(data['config'])))
+    simulation_classes = (EvolutionSimulation, BatchedEvolutionSimulation, TiledEvolutionSimulation)
+    simulation_class = {cls.__name__: cls for cls in simulation_classes}[engine]
+    simulation = simulation_class(config, **kwargs)
+    restore_checkpoint(simulation, path)
+    return simulation
+
+
+def get_batched_state(simulation: BatchedEvolutionSimulation) -> Dict[str, np.ndarray]:
+    h = simulation.habitat
+    arrays = {f'organism_{name}': getattr(h, name).copy() for name in ORGANISM_FIELDS}
+    arrays['food_cells'] = np.flatnonzero(h.food_grid).astype(np.int64)
+    arrays['rng_state'] = np.array(json.dumps(simulation.rng.bit_generator.state))
+    if isinstance(simulation, TiledEvolutionSimulation):
+        arrays['tile_rng_states'] = np.array(json.dumps([rng.bit_generator.state for rng in simulation.tile_rngs]))
+    arrays['engine'] = np.array(type(simulation).__name__)
+    return arrays
+
+
+def set_batched_state(simulation: BatchedEvolutionSimulation, data: Dict[str, np.ndarray]) -> None:
+    width = simulation.habitat_width
+    organisms = {name: data[f'organism_{name}'] for name in ORGANISM_FIELDS}
+    habitat = ArrayHabitat(width, max(len(organisms['x']), 1))
+    food_cells = data['food_cells']
+    habitat.add_food((food_cells % width).astype(np.int32), (food_cells // width).astype(np.int32))
+    habitat.add_organisms(organisms.pop('x'), organisms.pop('y'), **organisms)
+    simulation.habitat = habitat
+    simulation.rng.bit_generator.state = json.loads(str(data['rng_state']))
+    if isinstance(simulation, TiledEvolutionSimulation):
+        # the turns of a tiled run depend on its tiles, so the tiles of the checkpoint are kept
+        simulation.tile_rngs = []
+        for state in json.loads(str(data['tile_rng_states'])):
+            rng = np.random.default_rng()
+            rng.bit_generator.state = state
+            simulation.tile_rngs.append(rng)
+        simulation.tile_count = len(simulation.tile_rngs)
+    simulation.rendered_colors = None
+
+
+# entities are saved in the order of the EntityStore, along with their position within their cell and the order of
+# the habitat's occupied and contested cells, since all of these decide the order in which later turns visit them
+def get_reference_state(simulation: EvolutionSimulation) -> Dict[str, np.ndarray]:
+    entities = list(simulation.entities)
+    is_organism = [entity.mask_id == constants.ORGANISM_ID for entity in entities]
+    organism_default = EvolvingOrganism(0, 0)
+
+    def column(name: str, dtype: type) -> np.ndarray:
+        return np.array([getattr(e, name) if o else getattr(organism_default, name)
+                         for e, o in zip(entities, is_organism)], dtype=dtype)
+
+    version, internal_state, gauss_next = simulation.rng.getstate()
+    return {
+        'engine': np.array(type(simulation).__name__),
+        'entity_is_organism': np.array(is_organism, dtype=np.bool_),
+        'entity_id': np.array([e.entity_id for e in entities], dtype=np.int64),
+        'entity_x': np.array([e.x for e in entities], dtype=np.int32),
+        'entity_y': np.array([e.y for e in entities], dtype=np.int32),
+        'entity_cell_index': np.array([simulation.habitat.get_cell(e.x, e.y).index(e) for e in entities], dtype=np.int32),
+        'entity_color': np.array([e.color for e in entities], dtype=np.uint8).reshape(-1, 3),
+        'organism_food_count': column('food_count', np.float64),
+        # the age the organism has in simulation.turn, stored rather than the birth turn for the batched engines
+        'organism_age': np.array([e.get_age(simulation.turn) if o else 0 for e, o in zip(entities, is_organism)],
+                                 dtype=np.int32),
+        'organism_sight': column('sight', np.int32),
+        'organism_speed': column('speed', np.int32),
+        'organism_size': column('size', np.int32),
+        'organism_is_aggressive': column('is_aggressive', np.bool_),
+        'next_entity_id': np.array(simulation.entities.next_id),
+        'occupied_cells': np.array(list(simulation.habitat.occupied_cells), dtype=np.int32).reshape(-1, 2),
+        'contested_cells': np.array(list(simulation.habitat.contested_cells), dtype=np.int32).reshape(-1, 2),
+        # the order of Habitat's free cell index decides which cells sampled spawning picks
+        'free_cells': np.array(getattr(simulation.habitat, 'free_cells', None) or [], dtype=np.int64),
+        'has_free_cells': np.array(getattr(simulation.habitat, 'free_cells', None) is not None),
+        'rng_version': np.array(version),
+        'rng_internal_state': np.array(internal_state, dtype=np.uint32),
+        'rng_gauss_next': np.array(np.nan if gauss_next is None else gauss_next),
+    }
+
+
+def set_reference_state(simulation: EvolutionSimulation, data: Dict[str, np.ndarray]) -> None:
+    columns = {name: data[name].tolist() for name in data if name.startswith(('entity_', 'organism_'))}
+    entities = []
+    for i, is_organism in enumerate(columns['entity_is_organism']):
+        x, y = columns['entity_x'][i], columns['entity_y'][i]
+        color = tuple(columns['entity_color'][i])
+        if is_organism:
+            entity = EvolvingOrganism(x, y, sight=columns['organism_sight'][i], speed=columns['organism_speed'][i],
+                                      size=columns['organism_size'][i],
+                                      is_aggressive=columns['organism_is_aggressive'][i], color=color,
+                                      config=simulation.config)
+            entity.food_count = columns['organism_food_count'][i]
+            entity.birth_turn = simulation.turn - columns['organism_age'][i]
+        else:
+            entity = Food(x, y, color)
+        entity.entity_id = columns['entity_id'][i]
+        entities.append(entity)
+    simulation.entities = EntityStore.from_entities(entities, int(data['next_entity_id']))
+    habitat = simulation.get_empty_habitat()
+    population_metrics = PopulationMetrics()
+    for i in np.argsort(data['entity_cell_index'], kind='stable').tolist():
+        entity = entities[i]
+        habitat.add(entity, entity.x, entity.y)
+        if entity.mask_id == constants.ORGANISM_ID:
+            population_metrics.add(entity)
+    habitat.occupied_cells = dict.fromkeys(map(tuple, data['occupied_cells'].tolist()))
+    habitat.contested_cells = dict.fromkeys(map(tuple, data['contested_cells'].tolist()))
+    habitat.dirty_cells.clear()
+    if bool(data['has_free_cells']):
+        habitat.set_free_cells(data['free_cells'].tolist())
+    simulation.habitat = habitat
+    simulation.population_metrics = population_metrics
+    simulation.reschedule_aging()
+    gauss_next = float(data['rng_gauss_next'])
+    simulation.rng.setstate((int(data['rng_version']), tuple(data['rng_internal_state'].tolist()),
+                             None if np.isnan(gauss_next) else gauss_next))
+
+
+# saves a checkpoint every interval turns. path may contain {turn}, which is replaced by the turn of the checkpoint,
+# otherwise each checkpoint replaces the previous one
+class Checkpointer:
+    def __init__(self, path: str, interval: int) -> None:
+        self.path: str = path
+        self.interval: int = interval
+
+    def on_turn(self, simulation: AnySimulation) -> None:
+        if simulation.turn % self.interval == 0:
+            save_checkpoint(simulation, self.path.format(turn=simulation.turn))
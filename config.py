@@ -0,0 +1,59 @@
+import json
+from dataclasses import dataclass, asdict, fields, replace
+from typing import Any, Dict
+
+import constants
+
+
+# environment parameters of one simulation. each simulation and its organisms read these from their own config, so
+# differently configured simulations can run side by side in one process
+@dataclass(frozen=True)
+class SimulationConfig:
+    habitat_width: int = 200
+    # how many pixels wide each cell is drawn
+    block_width: int = 6
+    initial_food_spawn_probability: float = 0.5
+    organism_spawn_probability: float = 0.005
+    # probability of food spawning in an empty cell each turn
+    food_spawn_probability: float = 0.001
+    move_cost: float = constants.MOVE_COST
+    cost_to_live: float = constants.COST_TO_LIVE
+    start_food: float = constants.START_FOOD
+    reproduction_cost: float = constants.REPRODUCTION_COST
+    max_age: int = constants.MAX_AGE
+    # how the object based simulations store their habitat, a key of habitat.HABITAT_BACKENDS. 'sparse' only
+    # allocates the parts of the habitat that hold entities, for habitats too large to store cell by cell
+    habitat_backend: str = 'dense'
+    # 'per_cell' rolls for every empty cell when spawning, 'sampled' draws the number of new entities and picks that
+    # many empty cells, which costs far less when few entities spawn at a time
+    spawn_mode: str = 'per_cell'
+    # 'inline' draws each frame on the simulation's thread, which waits for it. 'block', 'drop' and 'latest' hand the
+    # frames to a display thread through a queue of render_queue_size frames, see render_pipeline.RENDER_QUEUE_POLICIES
+    render_queue_policy: str = 'inline'
+    render_queue_size: int = 2
+
+    def replace(self, **changes: Any) -> 'SimulationConfig':
+        return replace(self, **changes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, values: Dict[str, Any]) -> 'SimulationConfig':
+        unknown = set(values) - {field.name for field in fields(cls)}
+        if unknown:
+            raise ValueError(f'unknown config values: {sorted(unknown)}')
+        return cls(**values)
+
+    def to_file(self, path: str) -> None:
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    # values missing from the file keep their defaults
+    @classmethod
+    def from_file(cls, path: str) -> 'SimulationConfig':
+        with open(path) as file:
+            return cls.from_dict(json.load(file))
+
+
+DEFAULT_CONFIG = SimulationConfig()
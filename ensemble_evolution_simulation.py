@@ -0,0 +1,120 @@
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+import numpy as np
+
+from array_habitat import ArrayHabitat, ORGANISM_FIELDS
+from batched_evolution_simulation import BatchedEvolutionSimulation, get_spawn_positions
+from config import SimulationConfig, DEFAULT_CONFIG
+from metrics import MetricsRecorder
+from instrumentation import Instrumentation
+
+if TYPE_CHECKING:
+    from frame_export import FrameExporter
+
+
+# replicas habitats of width x width cells stacked on top of each other in one ArrayHabitat: replica r is rows
+# r * width to (r + 1) * width of the grids, and the y of its organisms is counted from the top of the whole stack.
+# also counts the food of each replica
+class EnsembleHabitat(ArrayHabitat):
+    def __init__(self, width: int, replicas: int, capacity: int = 1024) -> None:
+        super().__init__(width, capacity, height=width * replicas)
+        self.replicas: int = replicas
+        self.replica_food_totals: np.ndarray = np.zeros(replicas, dtype=np.int64)
+
+    def get_replicas(self, y: np.ndarray) -> np.ndarray:
+        return y // self.width
+
+    def add_food(self, x: np.ndarray, y: np.ndarray) -> None:
+        is_new = ~self.food_grid[y, x]
+        np.add.at(self.replica_food_totals, self.get_replicas(y[is_new]), 1)
+        super().add_food(x, y)
+
+    def remove_food(self, x: np.ndarray, y: np.ndarray) -> None:
+        is_present = self.food_grid[y, x]
+        np.subtract.at(self.replica_food_totals, self.get_replicas(y[is_present]), 1)
+        super().remove_food(x, y)
+
+
+# runs one BatchedEvolutionSimulation per seed (a replica) as a single simulation, so that each array operation of a
+# turn covers every replica at once instead of paying the interpreter overhead once per replica. replicas never see
+# or reach into each other: sight, moves and offspring stop at the border of their own habitat, and each replica draws
+# its random numbers from its own generator, for its own organisms in their own order. a replica therefore goes
+# through exactly the turns a BatchedEvolutionSimulation with its seed would, and get_replica returns it as one.
+# metrics_recorders, if given, hold a recorder per replica
+class EnsembleEvolutionSimulation(BatchedEvolutionSimulation):
+    def __init__(self, config: SimulationConfig = DEFAULT_CONFIG, seeds: Sequence[Optional[int]] = tuple(range(8)),
+                 metrics_recorders: Optional[List[MetricsRecorder]] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 frame_exporter: Optional['FrameExporter'] = None) -> None:
+        self.seeds: List[Optional[int]] = list(seeds)
+        self.rngs: List[np.random.Generator] = [np.random.default_rng(seed) for seed in self.seeds]
+        self.metrics_recorders: Optional[List[MetricsRecorder]] = metrics_recorders
+        super().__init__(config, headless=True, instrumentation=instrumentation, frame_exporter=frame_exporter)
+
+    @property
+    def replica_count(self) -> int:
+        return len(self.rngs)
+
+    def get_empty_habitat(self) -> EnsembleHabitat:
+        return EnsembleHabitat(self.habitat_width, self.replica_count)
+
+    # draws the values of each replica's organisms from the replica's generator, in the order of those organisms
+    def draw(self, organisms: np.ndarray, method: Callable[[np.random.Generator, int], np.ndarray]) -> np.ndarray:
+        replicas = self.habitat.get_replicas(self.habitat.y[organisms])
+        order = np.argsort(replicas, kind='stable')
+        counts = np.bincount(replicas, minlength=self.replica_count)
+        values = np.concatenate([method(rng, int(count)) for rng, count in zip(self.rngs, counts)])
+        result = np.empty_like(values)
+        result[order] = values
+        return result
+
+    def get_top_rows(self, organisms: np.ndarray) -> np.ndarray:
+        return self.habitat.get_replicas(self.habitat.y[organisms]) * self.habitat_width
+
+    # the organisms of the replica, in their order
+    def get_replica_organisms(self, replica: int) -> np.ndarray:
+        return np.flatnonzero(self.habitat.get_replicas(self.habitat.y) == replica)
+
+    # the rows of the grids that hold the replica
+    def get_replica_rows(self, replica: int) -> slice:
+        return slice(replica * self.habitat_width, (replica + 1) * self.habitat_width)
+
+    def get_spawn_positions(self, spawn_probability: float) -> Tuple[np.ndarray, np.ndarray]:
+        h = self.habitat
+        spawn_x, spawn_y = [], []
+        for replica, rng in enumerate(self.rngs):
+            rows = self.get_replica_rows(replica)
+            organisms = self.get_replica_organisms(replica)
+            x, y = get_spawn_positions(self.config.spawn_mode, spawn_probability, h.food_grid[rows],
+                                       h.organism_grid[rows], h.x[organisms], h.y[organisms] - rows.start,
+                                       int(h.replica_food_totals[replica]), rng)
+            spawn_x.append(x)
+            spawn_y.append(y + rows.start)
+        return np.concatenate(spawn_x), np.concatenate(spawn_y)
+
+    def record_metrics(self) -> None:
+        if self.metrics_recorders is None:
+            return
+        for replica, recorder in enumerate(self.metrics_recorders):
+            if recorder.should_record(self.turn):
+                recorder.record(self.turn, self.get_replica_metric_values(replica))
+
+    def get_replica_metric_values(self, replica: int) -> Dict[str, Optional[float]]:
+        return self.get_metric_values(self.get_replica_organisms(replica))
+
+    # a BatchedEvolutionSimulation in the state of the replica, which continues exactly as the replica would.
+    # kwargs are passed to its constructor
+    def get_replica(self, replica: int, **kwargs) -> BatchedEvolutionSimulation:
+        h = self.habitat
+        rows = self.get_replica_rows(replica)
+        organisms = self.get_replica_organisms(replica)
+        habitat = ArrayHabitat(self.habitat_width, max(len(organisms), 1))
+        food_y, food_x = np.nonzero(h.food_grid[rows])
+        habitat.add_food(food_x.astype(np.int32), food_y.astype(np.int32))
+        habitat.add_organisms(h.x[organisms], h.y[organisms] - rows.start,
+                              **{name: getattr(h, name)[organisms] for name in ORGANISM_FIELDS if name not in ('x', 'y')})
+        kwargs.setdefault('headless', True)
+        simulation = BatchedEvolutionSimulation(self.config, seed=self.seeds[replica], habitat=habitat, **kwargs)
+        simulation.rng.bit_generator.state = self.rngs[replica].bit_generator.state
+        simulation.turn = self.turn
+        return simulation
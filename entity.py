@@ -2,12 +2,18 @@ from typing import Tuple
 from abc import ABC, abstractmethod
 
 
+# entities declare __slots__ all the way down, since the habitat holds tens of thousands of them and an instance
+# __dict__ would be most of their memory. subclasses must list the attributes they add in their own __slots__
 class Entity(ABC):
+    __slots__ = ('x', 'y', 'mask_id', 'color', 'entity_id')
+
     def __init__(self, x: int, y: int, mask_id: int, color: Tuple[int, int, int]) -> None:
         self.x: int = x
         self.y: int = y
         self.mask_id = mask_id
         self.color: Tuple[int, int, int] = color
+        # assigned when the entity is added to an EntityStore
+        self.entity_id: int = -1
 
     # returns true if entity should remain in habitat, false if it should be removed
     @abstractmethod
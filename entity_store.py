@@ -0,0 +1,67 @@
+from typing import Callable, Dict, Iterator, List, Optional
+
+from entity import Entity
+
+
+# holds entities in the order they were added and gives each one a stable id. removing an entity leaves a tombstone
+# in its place so removal is O(1) and running iterations are not disturbed, compact clears the tombstones out
+class EntityStore:
+    def __init__(self) -> None:
+        self.__entities: List[Optional[Entity]] = []
+        # maps entity id to index in __entities
+        self.__indices: Dict[int, int] = {}
+        self.__next_id: int = 0
+
+    def __len__(self) -> int:
+        return len(self.__indices)
+
+    def __contains__(self, entity: Entity) -> bool:
+        return self.__indices.get(entity.entity_id) is not None and self.__entities[self.__indices[entity.entity_id]] is entity
+
+    # entities added during iteration are included, removed ones are skipped
+    def __iter__(self) -> Iterator[Entity]:
+        return filter(None, self.__entities)
+
+    def add(self, entity: Entity) -> int:
+        entity.entity_id = self.__next_id
+        self.__next_id += 1
+        self.__indices[entity.entity_id] = len(self.__entities)
+        self.__entities.append(entity)
+        return entity.entity_id
+
+    def remove(self, entity: Entity) -> None:
+        self.__entities[self.__indices.pop(entity.entity_id)] = None
+
+    # next_id is the id the next added entity gets
+    @classmethod
+    def from_entities(cls, entities: List[Entity], next_id: int) -> 'EntityStore':
+        store = cls()
+        store.__entities = list(entities)
+        store.__reindex()
+        store.__next_id = next_id
+        return store
+
+    @property
+    def next_id(self) -> int:
+        return self.__next_id
+
+    def get(self, entity_id: int) -> Optional[Entity]:
+        index = self.__indices.get(entity_id)
+        return None if index is None else self.__entities[index]
+
+    # must not be called while iterating
+    def compact(self) -> None:
+        if len(self.__entities) == len(self.__indices):
+            return
+        self.__entities = [entity for entity in self.__entities if entity is not None]
+        self.__reindex()
+
+    # shuffles the order of iteration in place with a function like random.shuffle, must not be called while iterating
+    def shuffle(self, shuffle_method: Callable[[list], None]) -> None:
+        if len(self.__entities) != len(self.__indices):
+            self.__entities = [entity for entity in self.__entities if entity is not None]
+        shuffle_method(self.__entities)
+        self.__reindex()
+
+    def __reindex(self) -> None:
+        self.__indices = {entity.entity_id: i for i, entity in enumerate(self.__entities)}
@@ -1,69 +1,123 @@
-from random import random, shuffle, choice
-from typing import List, Tuple, Dict
-from itertools import combinations
+from random import Random
+from typing import List, Tuple, Dict, Optional, TYPE_CHECKING
+
+import numpy as np
 
-from renderer import Renderer
 from organisms.evolving_organism import EvolvingOrganism
+from organisms.organism import AgingSchedule
 from direction import Direction
+from entity_store import EntityStore
+from habitat import BaseHabitat, HABITAT_BACKENDS
+from sampling import get_binomial_count
 from food import Food
 from entity import Entity
+from config import SimulationConfig, DEFAULT_CONFIG
+from metrics import MetricsRecorder, PopulationMetrics
+from instrumentation import Instrumentation, get_scanned_cell_count
+from lineage import NO_PARENT
 import constants
 
+if TYPE_CHECKING:
+    from checkpoint import Checkpointer
+    from frame_export import FrameExporter
+    from lineage import LineageRecorder
+    from render_pipeline import SimulationRenderer
+
 
 class EvolutionSimulation:
-    def __init__(self) -> None:
-        self.habitat_width: int = 200
+    # headless simulations never import pygame, render_interval is how many turns pass between rendered frames.
+    # every random decision is drawn from rng, so a given seed always produces the same sequence of turns.
+    # metrics_recorder, if given, receives the population metrics of the turns it samples, and checkpointer, if given,
+    # saves the state of the simulation as turns pass. instrumentation, if given, measures every turn, and
+    # frame_exporter, if given, records turns as frames without needing a window. lineage_recorder, if given, receives
+    # every birth and death of an organism
+    def __init__(self, config: SimulationConfig = DEFAULT_CONFIG, headless: bool = False, render_interval: int = 1,
+                 seed: Optional[int] = None, metrics_recorder: Optional[MetricsRecorder] = None,
+                 checkpointer: Optional['Checkpointer'] = None, instrumentation: Optional[Instrumentation] = None,
+                 frame_exporter: Optional['FrameExporter'] = None,
+                 lineage_recorder: Optional['LineageRecorder'] = None) -> None:
+        self.config: SimulationConfig = config
+        self.habitat_width: int = config.habitat_width
+        self.turn: int = 0
+        self.rng: Random = Random(seed)
+        self.render_interval: int = render_interval
         self.organism_types: List[type] = [EvolvingOrganism]
-        self.entities: List[Entity] = []
-        self.habitat: List[List[List[Entity]]] = self.get_empty_habitat()
-        self.renderer: Renderer = Renderer(6, self.habitat_width)
+        self.entities: EntityStore = EntityStore()
+        self.population_metrics: PopulationMetrics = PopulationMetrics()
+        self.metrics_recorder: Optional[MetricsRecorder] = metrics_recorder
+        self.checkpointer: Optional['Checkpointer'] = checkpointer
+        self.instrumentation: Optional[Instrumentation] = instrumentation
+        self.frame_exporter: Optional['FrameExporter'] = frame_exporter
+        self.lineage_recorder: Optional['LineageRecorder'] = lineage_recorder
+        self.aging_schedule: AgingSchedule = AgingSchedule()
+        self.renderer: Optional['SimulationRenderer'] = None if headless else self.get_renderer()
+        self.habitat: BaseHabitat = self.get_empty_habitat()
         self.spawn_organisms()
-        self.spawn_food()
+        self.spawn_food(self.config.initial_food_spawn_probability)
+
+    def get_renderer(self) -> 'SimulationRenderer':
+        # imported here so that pygame is only loaded when a window is actually needed
+        from render_pipeline import get_renderer
+        return get_renderer(self.config, self.habitat_width)
+
+    # runs forever if turns is None, otherwise returns after the given number of turns
+    def run(self, turns: Optional[int] = None) -> None:
+        if turns is None:
+            while True:
+                self.step()
+        for _ in range(turns):
+            self.step()
+
+    def step(self) -> None:
+        if self.should_render():
+            self.render()
+        if self.frame_exporter is not None:
+            self.frame_exporter.on_turn(self)
+        self.do_one_turn()
+        self.turn += 1
+        if self.checkpointer is not None:
+            self.checkpointer.on_turn(self)
+
+    def should_render(self) -> bool:
+        return self.renderer is not None and self.turn % self.render_interval == 0
 
-    def run(self) -> None:
-        while True:
-            self.do_one_turn()
+    # draws only the cells that changed since the last frame, or the whole habitat if too many of them changed
+    def render(self) -> None:
+        dirty_cells = self.habitat.pop_dirty_cells()
+        if self.renderer.should_render_fully(len(dirty_cells)):
+            self.renderer.render_array(self.get_color_array())
+        else:
+            self.renderer.render_cells({(x, y): self.get_cell_color(x, y) for x, y in dirty_cells})
 
     def do_one_turn(self):
-        self.renderer.render(self.get_board_for_renderer())
+        if self.instrumentation is not None:
+            self.do_one_turn_instrumented()
+            return
         self.move_organisms()
         self.do_collisions()
         self.check_if_present()
-        self.spawn_food(0.001)
+        self.spawn_food(self.config.food_spawn_probability)
         self.do_reproductions()
-        self.print_report()
-
-    def print_report(self):
-        total_speed = 0
-        total_sight = 0
-        total_red = 0
-        total_green = 0
-        total_blue = 0
-        total_size = 0
-        total_aggressive = 0
-        total_non_aggressive = 0
-        total_organisms = self.get_entity_type_count(EvolvingOrganism)
-        for entity in self.entities:
-            if isinstance(entity, EvolvingOrganism):
-                total_speed += entity.speed
-                total_sight += entity.sight
-                total_red += entity.color[0]
-                total_green += entity.color[1]
-                total_blue += entity.color[2]
-                total_size += entity.size
-                if entity.is_aggressive:
-                    total_aggressive += 1
-                else:
-                    total_non_aggressive += 1
-        print(f'AVERAGE SPEED: {total_speed / total_organisms}')
-        print(f'AVERAGE SIGHT: {total_sight / total_organisms}')
-        print(f'AVERAGE RED: {total_red / total_organisms}')
-        print(f'AVERAGE GREEN: {total_green / total_organisms}')
-        print(f'AVERAGE BLUE: {total_blue / total_organisms}')
-        print(f'AVERAGE SIZE: {total_size / total_organisms}')
-        print(f'TOTAL AGGRESSIVE: {total_aggressive}')
-        print(f'TOTAL NON AGGRESSIVE: {total_non_aggressive}')
-        print()
+        self.record_metrics()
+
+    # do_one_turn with every phase timed
+    def do_one_turn_instrumented(self) -> None:
+        instrumentation = self.instrumentation
+        instrumentation.start_turn(self.turn)
+        instrumentation.run_phase('move_organisms', self.move_organisms)
+        instrumentation.run_phase('do_collisions', self.do_collisions)
+        instrumentation.run_phase('check_if_present', self.check_if_present)
+        instrumentation.run_phase('spawn_food', self.spawn_food, self.config.food_spawn_probability)
+        instrumentation.run_phase('do_reproductions', self.do_reproductions)
+        instrumentation.run_phase('record_metrics', self.record_metrics)
+        instrumentation.end_turn()
+
+    def record_metrics(self) -> None:
+        if self.metrics_recorder is not None and self.metrics_recorder.should_record(self.turn):
+            self.metrics_recorder.record(self.turn, self.get_metric_values())
+
+    def get_metric_values(self) -> Dict[str, Optional[float]]:
+        return self.population_metrics.get_values()
 
     def print_organism_counts(self):
         for o_type in self.organism_types:
@@ -77,61 +131,89 @@ class EvolutionSimulation:
                 count += 1
         return count
 
-    def kill_entity(self, entity: Entity, x: int, y: int):
-        self.habitat[y][x].remove(entity)
+    # cause is one of lineage.DEATH_CAUSES, only recorded for organisms
+    def kill_entity(self, entity: Entity, x: int, y: int, cause: str):
+        self.habitat.remove(entity, x, y)
         self.entities.remove(entity)
+        if entity.mask_id == constants.ORGANISM_ID:
+            self.population_metrics.remove(entity)
+            if self.instrumentation is not None:
+                self.instrumentation.count('deaths')
+            if self.lineage_recorder is not None:
+                self.lineage_recorder.record_death(entity, self.turn, cause)
 
-    def do_collision(self, a: Entity, b: Entity, x: int, y: int):
-        a_survives, b_survives = a.collide(b), b.collide(a)
-        if not a_survives:
-            self.kill_entity(a, x, y)
-        if not b_survives:
-            self.kill_entity(b, x, y)
-
+    # only cells an entity was moved or spawned into since the last pass can hold new collisions
     def do_collisions(self):
-        for y in range(self.habitat_width):
-            for x in range(self.habitat_width):
-                if len(self.habitat[y][x]) > 1:
-                    for pair in combinations(self.habitat[y][x], 2):
-                        # make sure that one of the entities here didn't die in last collision
-                        if pair[0] in self.habitat[y][x] and pair[1] in self.habitat[y][x]:
-                            self.do_collision(pair[0], pair[1], x, y)
+        for x, y in self.habitat.pop_contested_cells():
+            cell = self.habitat.get_cell(x, y)
+            if len(cell) > 1:
+                self.do_cell_collisions(x, y, list(cell))
+
+    # resolves the cell in one pass: the first of the largest organisms eats the food and every smaller organism at
+    # once, and organisms of its size are left alone. colliding every pair in the order of combinations(cell, 2) comes
+    # to the same, since whatever a smaller organism eats before it is eaten ends up with the largest one, only the
+    # food is added up in a different order
+    def do_cell_collisions(self, x: int, y: int, cell: List[Entity]) -> None:
+        organisms = [entity for entity in cell if entity.mask_id == constants.ORGANISM_ID]
+        if not organisms:
+            return
+        largest = max(organisms, key=lambda organism: organism.size)
+        eaten = [organism for organism in organisms if organism.size < largest.size]
+        food = [entity for entity in cell if entity.mask_id == constants.FOOD_ID]
+        if self.instrumentation is not None:
+            self.instrumentation.count('collisions', len(eaten) + len(food))
+        largest.food_count += sum(organism.food_count for organism in eaten) + len(food)
+        for entity in cell:
+            if entity.mask_id == constants.FOOD_ID or entity.size < largest.size:
+                self.kill_entity(entity, x, y, 'eaten')
 
     def do_reproductions(self):
         for entity in self.entities:
             if self.is_organism(entity):
                 possible_directions = self.get_possible_directions(entity)
                 if possible_directions != []:
-                    delta_x, delta_y = choice(possible_directions).value
+                    delta_x, delta_y = self.rng.choice(possible_directions).value
                     x = entity.x + delta_x
                     y = entity.y + delta_y
-                    offspring = entity.get_offspring(x, y)
+                    offspring = entity.get_offspring(x, y, self.rng)
                     if offspring is not None:
-                        self.spawn_entity(offspring, x, y)
+                        # born after this turn's aging check
+                        offspring.birth_turn = self.turn + 1
+                        self.spawn_entity(offspring, x, y, entity.entity_id)
+                        if self.instrumentation is not None:
+                            self.instrumentation.count('births')
 
+    # the aging check, see AgingSchedule
     def check_if_present(self):
-        for y in range(self.habitat_width):
-            for x in range(self.habitat_width):
-                for entity in self.habitat[y][x]:
-                    if not entity.is_present():
-                        self.kill_entity(entity, x, y)
+        for organism in self.aging_schedule.pop_due(self.turn, self.entities):
+            is_old = organism.get_death_turn() == self.turn
+            if is_old or not organism.is_present():
+                self.kill_entity(organism, organism.x, organism.y, 'old_age' if is_old else 'starvation')
+
+    # rebuilds the aging schedule from the live organisms, after they were replaced
+    def reschedule_aging(self) -> None:
+        self.aging_schedule = AgingSchedule()
+        for entity in self.entities:
+            if entity.mask_id == constants.ORGANISM_ID:
+                self.aging_schedule.add(entity)
 
     def move_organism(self, organism: EvolvingOrganism, direction: Direction) -> None:
-        organism.food_count -= constants.MOVE_COST * organism.size
+        organism.food_count -= self.config.move_cost * organism.size
         if organism.food_count <= 0:
             return
-        self.habitat[organism.y][organism.x].remove(organism)
         delta_x, delta_y = direction.value
+        self.habitat.move(organism, organism.x, organism.y, organism.x + delta_x, organism.y + delta_y)
         organism.x += delta_x
         organism.y += delta_y
-        self.habitat[organism.y][organism.x].append(organism)
 
     def move_organisms(self) -> None:
         # shuffle organisms, so first organisms don't always have an advantage of getting a desirable spot
-        shuffle(self.entities)
+        self.entities.shuffle(self.rng.shuffle)
         for entity in self.entities:
             if self.is_organism(entity):
-                moves = entity.get_moves(self.get_sight(entity))
+                if self.instrumentation is not None:
+                    self.instrumentation.count('entities_visited')
+                moves = entity.get_moves(self.get_sight(entity), self.rng, self.turn)
                 for move in moves:
                     delta_x, delta_y = move.value
                     new_x = entity.x + delta_x
@@ -140,26 +222,41 @@ class EvolutionSimulation:
                         self.move_organism(entity, move)
                     else:
                         break
+                # moving is the only thing that uses up food
+                self.aging_schedule.add_starving([entity])
 
-    def get_sight(self, entity: Entity) -> Dict[Direction, list]:
+    # an EvolvingOrganism only scores what is within its sight and moves at most speed cells, so nothing further away
+    # than that can change its moves
+    def get_sight(self, entity: EvolvingOrganism) -> Dict[Direction, list]:
         return_dict = {}
+        limit = max(entity.sight, entity.speed)
         for direction in Direction:
-            return_dict[direction] = self.get_sight_in_direction(entity, direction)
+            return_dict[direction] = self.get_sight_in_direction(entity, direction, limit)
+        if self.instrumentation is not None:
+            self.instrumentation.count('sight_cells_scanned', get_scanned_cell_count(return_dict))
         return return_dict
 
-    def get_sight_in_direction(self, entity: Entity, direction: Direction) -> list:
-        count = 0
-        x = entity.x
-        y = entity.y
-        while True:
-            count += 1
+    # returns the distance to and color of the nearest entity in direction, or the distance to the border and None if
+    # there is none. with a limit, anything further away than limit is reported as [limit + 1, None]
+    def get_sight_in_direction(self, entity: Entity, direction: Direction, limit: Optional[int] = None) -> list:
+        distance = self.habitat.index.get_distance(entity.x, entity.y, direction, limit)
+        if distance is not None:
             delta_x, delta_y = direction.value
-            x += delta_x
-            y += delta_y
-            if not 0 <= x < self.habitat_width or not 0 <= y < self.habitat_width:
-                return [count, None]
-            if self.habitat[y][x] != []:
-                return [count, self.get_visible_entity(x, y).color]
+            return [distance, self.get_visible_entity(entity.x + delta_x * distance, entity.y + delta_y * distance).color]
+        border_distance = self.get_border_distance(entity, direction)
+        if limit is not None and border_distance > limit:
+            return [limit + 1, None]
+        return [border_distance, None]
+
+    # number of steps in direction until entity would be outside of the habitat
+    def get_border_distance(self, entity: Entity, direction: Direction) -> int:
+        if direction == Direction.NORTH:
+            return entity.y + 1
+        if direction == Direction.SOUTH:
+            return self.habitat_width - entity.y
+        if direction == Direction.EAST:
+            return self.habitat_width - entity.x
+        return entity.x + 1
 
     def get_possible_directions(self, organism: EvolvingOrganism) -> List[Direction]:
         possible_directions = []
@@ -172,17 +269,20 @@ class EvolutionSimulation:
     def is_valid_space(self, x: int, y: int, organism: EvolvingOrganism) -> bool:
         if not 0 <= x < self.habitat_width or not 0 <= y < self.habitat_width:
             return False
-        # for entity in self.habitat[y][x]:
+        # for entity in self.habitat.get_cell(x, y):
         #     if entity.mask_id == organism.mask_id:
         #         return False
         return True
 
-    def get_empty_habitat(self) -> List[List[List]]:
-        return [[[] for _ in range(self.habitat_width)] for _ in range(self.habitat_width)]
+    def get_empty_habitat(self) -> BaseHabitat:
+        if self.config.habitat_backend not in HABITAT_BACKENDS:
+            raise ValueError(f'unknown habitat backend: {self.config.habitat_backend}')
+        habitat_class = HABITAT_BACKENDS[self.config.habitat_backend]
+        return habitat_class(self.habitat_width, track_dirty_cells=self.renderer is not None)
 
     def get_organism(self, x: int, y: int) -> EvolvingOrganism:
-        chosen_type = choice(self.organism_types)
-        return chosen_type(x, y)
+        chosen_type = self.rng.choice(self.organism_types)
+        return chosen_type(x, y, config=self.config, birth_turn=self.turn)
 
     def is_organism(self, entity: Entity) -> bool:
         return any([isinstance(entity, o_type) for o_type in self.organism_types])
@@ -190,23 +290,44 @@ class EvolutionSimulation:
     def get_food(self, x: int, y: int) -> Food:
         return Food(x, y)
 
-    def spawn_food(self, spawn_probability: float = 0.5) -> None:
+    def spawn_food(self, spawn_probability: float) -> None:
         self.spawn_entities(spawn_probability, self.get_food)
 
     def spawn_organisms(self) -> None:
-        self.spawn_entities(0.005, self.get_organism)
+        self.spawn_entities(self.config.organism_spawn_probability, self.get_organism)
 
-    def spawn_entity(self, entity: Entity, x: int, y: int) -> None:
-        self.habitat[y][x].append(entity)
-        self.entities.append(entity)
+    # parent_id is the id of the organism that gave birth to entity
+    def spawn_entity(self, entity: Entity, x: int, y: int, parent_id: int = NO_PARENT) -> None:
+        self.habitat.add(entity, x, y)
+        self.entities.add(entity)
+        if entity.mask_id == constants.ORGANISM_ID:
+            self.population_metrics.add(entity)
+            self.aging_schedule.add(entity)
+            if self.lineage_recorder is not None:
+                self.lineage_recorder.record_birth(entity, parent_id)
 
     def spawn_entities(self, spawn_probability: float, get_entity_method) -> None:
-        adjusted_spawn_probability = self.get_adjusted_spawn_probability(spawn_probability)
-        for y in range(self.habitat_width):
-            for x in range(self.habitat_width):
-                if self.habitat[y][x] == [] and random() < adjusted_spawn_probability:
-                    new_entity = get_entity_method(x, y)
-                    self.spawn_entity(new_entity, x, y)
+        if self.config.spawn_mode == 'sampled':
+            positions = self.get_sampled_spawn_positions(spawn_probability)
+        elif self.config.spawn_mode == 'per_cell':
+            adjusted_spawn_probability = self.get_adjusted_spawn_probability(spawn_probability)
+            positions = self.habitat.iterate_spawn_positions(adjusted_spawn_probability, self.rng)
+        else:
+            raise ValueError(f'unknown spawn mode: {self.config.spawn_mode}')
+        for x, y in positions:
+            new_entity = get_entity_method(x, y)
+            self.spawn_entity(new_entity, x, y)
+
+    # draws how many entities the per cell rolls would spawn from their binomial distribution and picks that many
+    # distinct empty cells, so the cost depends on the number spawned instead of the size of the habitat. empty cells
+    # are counted by the habitat, so cells holding several entities don't skew the probability the way
+    # get_adjusted_spawn_probability does
+    def get_sampled_spawn_positions(self, spawn_probability: float) -> List[Tuple[int, int]]:
+        empty_count = self.habitat.get_empty_cell_count()
+        if empty_count == 0:
+            return []
+        probability = min(spawn_probability * self.habitat_width ** 2 / empty_count, 1)
+        return self.habitat.sample_empty_cells(get_binomial_count(empty_count, probability, self.rng), self.rng)
 
     # this method adjusts spawn probability based on how many entities there already. for example, if there are 4
     # spaces, and 2 of these contain organisms, and we want food to have a 0.5 spawn probability then the actual
@@ -222,12 +343,23 @@ class EvolutionSimulation:
         return min(spawn_probability * ratio, 1)
 
     def get_visible_entity(self, x: int, y: int) -> Entity:
-        return max(self.habitat[y][x], key=lambda e: e.mask_id)
+        return max(self.habitat.get_cell(x, y), key=lambda e: e.mask_id)
 
     def get_board_for_renderer(self, default_color: Tuple[int, int, int] = (0, 0, 0)) -> List[List[Tuple[int, int, int]]]:
         board = [[default_color for _ in range(self.habitat_width)] for _ in range(self.habitat_width)]
-        for y in range(self.habitat_width):
-            for x in range(self.habitat_width):
-                if self.habitat[y][x] != []:
-                    board[y][x] = self.get_visible_entity(x, y).color
+        for x, y in self.habitat.occupied_cells:
+            board[y][x] = self.get_visible_entity(x, y).color
         return board
+
+    def get_cell_color(self, x: int, y: int, default_color: Tuple[int, int, int] = (0, 0, 0)) -> Tuple[int, int, int]:
+        if not self.habitat.get_cell(x, y):
+            return default_color
+        return self.get_visible_entity(x, y).color
+
+    # same as get_board_for_renderer, as a habitat_width x habitat_width x 3 array
+    def get_color_array(self, default_color: Tuple[int, int, int] = (0, 0, 0)) -> np.ndarray:
+        colors = np.empty((self.habitat_width, self.habitat_width, 3), dtype=np.uint8)
+        colors[:] = default_color
+        for x, y in self.habitat.occupied_cells:
+            colors[y, x] = self.get_visible_entity(x, y).color
+        return colors
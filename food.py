@@ -5,6 +5,8 @@ import constants
 
 
 class Food(Entity):
+    __slots__ = ()
+
     def __init__(self, x: int, y: int, color: Tuple[int, int, int] = constants.GREEN) -> None:
         super().__init__(x, y, constants.FOOD_ID, color)
 
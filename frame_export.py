@@ -0,0 +1,170 @@
+import struct
+import subprocess
+import zlib
+from abc import ABC, abstractmethod
+from queue import Queue
+from threading import Thread
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# first bytes of a file written by FrameFileSink
+FRAME_FILE_MAGIC = b'EVOFRM1\n'
+# turn, height, width and compressed length of each frame of a frame file
+FRAME_HEADER = struct.Struct('<qIII')
+
+
+# receives the frames of an export, each a height x width x 3 uint8 RGB array indexed by [y][x]
+class FrameSink(ABC):
+    @abstractmethod
+    def write(self, turn: int, frame: np.ndarray) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+# file made of a header per frame (FRAME_HEADER) followed by the zlib compressed RGB bytes of the frame. most cells of a
+# habitat are empty, so frames compress well. read it back with read_frames
+class FrameFileSink(FrameSink):
+    def __init__(self, path: str, level: int = 6) -> None:
+        self.path: str = path
+        self.level: int = level
+        self.file = open(path, 'wb')
+        self.file.write(FRAME_FILE_MAGIC)
+
+    def write(self, turn: int, frame: np.ndarray) -> None:
+        data = zlib.compress(np.ascontiguousarray(frame).tobytes(), self.level)
+        self.file.write(FRAME_HEADER.pack(turn, frame.shape[0], frame.shape[1], len(data)))
+        self.file.write(data)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def read_frames(path: str) -> Iterator[Tuple[int, np.ndarray]]:
+    with open(path, 'rb') as file:
+        if file.read(len(FRAME_FILE_MAGIC)) != FRAME_FILE_MAGIC:
+            raise ValueError(f'{path} is not a frame file')
+        while True:
+            header = file.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            turn, height, width, length = FRAME_HEADER.unpack(header)
+            frame = np.frombuffer(zlib.decompress(file.read(length)), dtype=np.uint8).reshape(height, width, 3)
+            yield turn, frame
+
+
+# pipes the frames as raw RGB video into an external encoder, ffmpeg by default. the encoder is started with the first
+# frame, since its command line needs the frame size. every frame must have the same size
+class EncoderPipeSink(FrameSink):
+    def __init__(self, path: str, fps: int = 30, executable: str = 'ffmpeg',
+                 output_options: Optional[List[str]] = None) -> None:
+        self.path: str = path
+        self.fps: int = fps
+        self.executable: str = executable
+        # h264 in yuv420p needs an even width and height
+        self.output_options: List[str] = output_options if output_options is not None else \
+            ['-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p']
+        self.process: Optional[subprocess.Popen] = None
+
+    def get_command(self, width: int, height: int) -> List[str]:
+        return [self.executable, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                '-s', f'{width}x{height}', '-r', str(self.fps), '-i', '-'] + self.output_options + [self.path]
+
+    def write(self, turn: int, frame: np.ndarray) -> None:
+        if self.process is None:
+            self.process = subprocess.Popen(self.get_command(frame.shape[1], frame.shape[0]), stdin=subprocess.PIPE)
+        self.process.stdin.write(np.ascontiguousarray(frame).tobytes())
+
+    def close(self) -> None:
+        if self.process is not None:
+            self.process.stdin.close()
+            if self.process.wait() != 0:
+                raise RuntimeError(f'{self.executable} exited with {self.process.returncode} writing {self.path}')
+            self.process = None
+
+
+# averages each downscale x downscale block of cells into one pixel. blocks at the right and bottom edges are cut
+# short when the width is not a multiple of downscale
+def downscale_frame(frame: np.ndarray, downscale: int) -> np.ndarray:
+    if downscale == 1:
+        return frame
+    rows = np.arange(0, frame.shape[0], downscale)
+    columns = np.arange(0, frame.shape[1], downscale)
+    sums = np.add.reduceat(np.add.reduceat(frame.astype(np.uint32), rows, axis=0), columns, axis=1)
+    counts = np.outer(np.diff(np.append(rows, frame.shape[0])), np.diff(np.append(columns, frame.shape[1])))
+    return ((sums + counts[:, :, None] // 2) // counts[:, :, None]).astype(np.uint8)
+
+
+# records every stride-th turn of a simulation as a frame, without a window. the simulation hands over its color
+# array, one buffer per frame, and everything else (downscaling, scaling up to cell_pixels pixels per cell, compressing
+# or encoding) happens on a background thread. up to queue_size frames wait for that thread; when it falls further
+# behind, the simulation waits for it rather than frames being dropped. close, or use the exporter as a context
+# manager, to write the remaining frames and close the sinks
+class FrameExporter:
+    def __init__(self, sinks: List[FrameSink], stride: int = 1, downscale: int = 1, cell_pixels: int = 1,
+                 queue_size: int = 16) -> None:
+        self.sinks: List[FrameSink] = sinks
+        self.stride: int = stride
+        self.downscale: int = downscale
+        self.cell_pixels: int = cell_pixels
+        self.frames: Queue = Queue(queue_size)
+        # the first exception raised on the writer thread stops writing, and is raised once in the simulation's thread
+        self.failed: bool = False
+        self.error: Optional[BaseException] = None
+        self.thread: Thread = Thread(target=self.write_frames, daemon=True)
+        self.thread.start()
+
+    def __enter__(self) -> 'FrameExporter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def should_export(self, turn: int) -> bool:
+        return turn % self.stride == 0
+
+    def on_turn(self, simulation) -> None:
+        if self.should_export(simulation.turn):
+            self.export(simulation.turn, simulation.get_color_array())
+
+    # frame must not be changed afterwards, it is written on the writer thread
+    def export(self, turn: int, frame: np.ndarray) -> None:
+        self.raise_error()
+        self.frames.put((turn, frame))
+
+    def get_output_frame(self, frame: np.ndarray) -> np.ndarray:
+        frame = downscale_frame(frame, self.downscale)
+        if self.cell_pixels > 1:
+            frame = np.repeat(np.repeat(frame, self.cell_pixels, axis=0), self.cell_pixels, axis=1)
+        return frame
+
+    def write_frames(self) -> None:
+        while True:
+            item = self.frames.get()
+            if item is None:
+                return
+            if self.failed:
+                continue
+            turn, frame = item
+            try:
+                frame = self.get_output_frame(frame)
+                for sink in self.sinks:
+                    sink.write(turn, frame)
+            except BaseException as error:
+                self.failed = True
+                self.error = error
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def close(self) -> None:
+        if self.thread.is_alive():
+            self.frames.put(None)
+            self.thread.join()
+        for sink in self.sinks:
+            sink.close()
+        self.raise_error()
@@ -0,0 +1,210 @@
+from abc import ABC, abstractmethod
+from array import array
+from random import Random
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from entity import Entity
+from occupancy_index import OccupancyIndex
+from sampling import iterate_bernoulli_positions
+
+# SparseHabitat groups cells in chunks of CHUNK_WIDTH x CHUNK_WIDTH cells
+CHUNK_WIDTH = 64
+
+
+# interface of the habitats the simulations keep their entities in. a habitat maps each cell to the list of entities
+# in it, and tracks which cells are occupied and which cells have had an entity added to an already occupied cell
+# (contested cells, the only places collisions can happen), so that passes over the habitat only have to visit those
+# cells. it also collects the cells whose contents changed since they were last rendered (dirty cells). dicts are used
+# as ordered sets so that the order of visiting cells only depends on the order of events. subclasses decide how the
+# cell lists are stored
+class BaseHabitat(ABC):
+    # dirty cells are only collected with track_dirty_cells, so that headless simulations don't accumulate them
+    def __init__(self, width: int, track_dirty_cells: bool = False) -> None:
+        self.width: int = width
+        self.track_dirty_cells: bool = track_dirty_cells
+        self.occupied_cells: Dict[Tuple[int, int], None] = {}
+        self.contested_cells: Dict[Tuple[int, int], None] = {}
+        self.dirty_cells: Dict[Tuple[int, int], None] = {}
+        self.index: OccupancyIndex = OccupancyIndex()
+
+    # the entities at (x, y). only add and remove may change the list
+    @abstractmethod
+    def get_cell(self, x: int, y: int) -> List[Entity]:
+        pass
+
+    # the list an entity added at (x, y) is appended to
+    @abstractmethod
+    def get_cell_for_adding(self, x: int, y: int) -> List[Entity]:
+        pass
+
+    # called when the first entity was added to (x, y)
+    def occupy_cell(self, x: int, y: int) -> None:
+        pass
+
+    # called when the last entity left (x, y)
+    def release_cell(self, x: int, y: int) -> None:
+        pass
+
+    def get_empty_cell_count(self) -> int:
+        return self.width * self.width - len(self.occupied_cells)
+
+    # count distinct empty cells picked uniformly at random, count must not exceed get_empty_cell_count
+    @abstractmethod
+    def sample_empty_cells(self, count: int, rng: Random) -> List[Tuple[int, int]]:
+        pass
+
+    # empty cells, each picked with probability, in row by row order. positions are produced one at a time so that
+    # cells filled while iterating are skipped and random numbers are drawn in the same order as spawning
+    @abstractmethod
+    def iterate_spawn_positions(self, probability: float, rng: Random) -> Iterator[Tuple[int, int]]:
+        pass
+
+    def add(self, entity: Entity, x: int, y: int) -> None:
+        cell = self.get_cell_for_adding(x, y)
+        cell.append(entity)
+        if len(cell) == 1:
+            self.occupied_cells[(x, y)] = None
+            self.occupy_cell(x, y)
+        else:
+            self.contested_cells[(x, y)] = None
+        if self.track_dirty_cells:
+            self.dirty_cells[(x, y)] = None
+        self.index.add(x, y)
+
+    def remove(self, entity: Entity, x: int, y: int) -> None:
+        cell = self.get_cell(x, y)
+        cell.remove(entity)
+        if not cell:
+            del self.occupied_cells[(x, y)]
+            self.release_cell(x, y)
+        if self.track_dirty_cells:
+            self.dirty_cells[(x, y)] = None
+        self.index.remove(x, y)
+
+    def move(self, entity: Entity, from_x: int, from_y: int, to_x: int, to_y: int) -> None:
+        self.remove(entity, from_x, from_y)
+        self.add(entity, to_x, to_y)
+
+    # returns the contested cells and starts collecting new ones
+    def pop_contested_cells(self) -> List[Tuple[int, int]]:
+        contested_cells = list(self.contested_cells)
+        self.contested_cells.clear()
+        return contested_cells
+
+    # returns the dirty cells and starts collecting new ones
+    def pop_dirty_cells(self) -> List[Tuple[int, int]]:
+        dirty_cells = list(self.dirty_cells)
+        self.dirty_cells.clear()
+        return dirty_cells
+
+
+# habitat with a preallocated list for every cell, the fastest choice while the whole grid fits in memory
+class Habitat(BaseHabitat):
+    def __init__(self, width: int, track_dirty_cells: bool = False) -> None:
+        super().__init__(width, track_dirty_cells)
+        self.cells: List[List[List[Entity]]] = [[[] for _ in range(width)] for _ in range(width)]
+        # y * width + x of every empty cell in no particular order, and the position of each cell in free_cells (or
+        # -1 when it is occupied). only built once empty cells are first sampled, so that habitats which never sample
+        # don't pay for keeping it up to date
+        self.free_cells: Optional[array] = None
+        self.free_cell_positions: Optional[array] = None
+
+    def get_cell(self, x: int, y: int) -> List[Entity]:
+        return self.cells[y][x]
+
+    def get_cell_for_adding(self, x: int, y: int) -> List[Entity]:
+        return self.cells[y][x]
+
+    # builds the free cell index from the empty cells in the given order
+    def set_free_cells(self, free_cells: Iterable[int]) -> None:
+        self.free_cells = array('q', free_cells)
+        self.free_cell_positions = array('q', [-1]) * (self.width * self.width)
+        for position, i in enumerate(self.free_cells):
+            self.free_cell_positions[i] = position
+
+    def occupy_cell(self, x: int, y: int) -> None:
+        if self.free_cells is None:
+            return
+        i = y * self.width + x
+        position = self.free_cell_positions[i]
+        last = self.free_cells.pop()
+        if last != i:
+            self.free_cells[position] = last
+            self.free_cell_positions[last] = position
+        self.free_cell_positions[i] = -1
+
+    def release_cell(self, x: int, y: int) -> None:
+        if self.free_cells is None:
+            return
+        i = y * self.width + x
+        self.free_cell_positions[i] = len(self.free_cells)
+        self.free_cells.append(i)
+
+    def sample_empty_cells(self, count: int, rng: Random) -> List[Tuple[int, int]]:
+        if self.free_cells is None:
+            self.set_free_cells(y * self.width + x for y, row in enumerate(self.cells)
+                                for x, cell in enumerate(row) if not cell)
+        return [(i % self.width, i // self.width) for i in rng.sample(self.free_cells, count)]
+
+    # draws a random number for every empty cell
+    def iterate_spawn_positions(self, probability: float, rng: Random) -> Iterator[Tuple[int, int]]:
+        for y, row in enumerate(self.cells):
+            for x, cell in enumerate(row):
+                if not cell and rng.random() < probability:
+                    yield x, y
+
+
+# habitat that only stores the cells that hold entities, grouped in square chunks that are created when an entity is
+# first added to them and dropped when their last cell empties. its memory grows with the number of entities instead of
+# the size of the world, and spawning skips between the picked cells instead of rolling for every cell. the world is
+# still bounded by width, since the simulations treat its border as a wall
+class SparseHabitat(BaseHabitat):
+    def __init__(self, width: int, track_dirty_cells: bool = False) -> None:
+        super().__init__(width, track_dirty_cells)
+        # maps (x // CHUNK_WIDTH, y // CHUNK_WIDTH) to the occupied cells of the chunk by (x, y)
+        self.chunks: Dict[Tuple[int, int], Dict[Tuple[int, int], List[Entity]]] = {}
+
+    # empty cells are not stored, they get a new empty list
+    def get_cell(self, x: int, y: int) -> List[Entity]:
+        chunk = self.chunks.get((x // CHUNK_WIDTH, y // CHUNK_WIDTH))
+        if chunk is None:
+            return []
+        return chunk.get((x, y), [])
+
+    def get_cell_for_adding(self, x: int, y: int) -> List[Entity]:
+        key = (x // CHUNK_WIDTH, y // CHUNK_WIDTH)
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            chunk = self.chunks[key] = {}
+        cell = chunk.get((x, y))
+        if cell is None:
+            cell = chunk[(x, y)] = []
+        return cell
+
+    def release_cell(self, x: int, y: int) -> None:
+        key = (x // CHUNK_WIDTH, y // CHUNK_WIDTH)
+        chunk = self.chunks[key]
+        del chunk[(x, y)]
+        if not chunk:
+            del self.chunks[key]
+
+    # picks random cells until count empty ones are found, which stays cheap as long as most of the world is empty
+    def sample_empty_cells(self, count: int, rng: Random) -> List[Tuple[int, int]]:
+        picked: Dict[Tuple[int, int], None] = {}
+        while len(picked) < count:
+            position = (rng.randrange(self.width), rng.randrange(self.width))
+            if position not in self.occupied_cells:
+                picked[position] = None
+        return list(picked)
+
+    # picks cells of the whole world with geometric skips and leaves out the occupied ones, which picks each empty cell
+    # with probability like Habitat does, at a cost that grows with the number of cells picked
+    def iterate_spawn_positions(self, probability: float, rng: Random) -> Iterator[Tuple[int, int]]:
+        for i in iterate_bernoulli_positions(self.width * self.width, probability, rng):
+            position = (i % self.width, i // self.width)
+            if position not in self.occupied_cells:
+                yield position
+
+
+# values of SimulationConfig.habitat_backend
+HABITAT_BACKENDS: Dict[str, type] = {'dense': Habitat, 'sparse': SparseHabitat}
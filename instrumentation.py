@@ -0,0 +1,117 @@
+import time
+from collections import deque
+from threading import Lock
+from typing import Callable, Deque, Dict, List, Optional
+
+from direction import Direction
+
+# counters the simulations report. collisions is the number of entities eaten in collisions, food and organisms alike.
+# sight_cells_scanned is the number of cells between organisms and what they saw, which is what looking cell by cell
+# would visit
+COUNTERS: List[str] = ['entities_visited', 'collisions', 'sight_cells_scanned', 'births', 'deaths']
+
+
+# sight_cells_scanned of a sight dict of the object simulations, which map each direction to the distance to what was
+# seen and what it was (None for nothing or the border, which is one step beyond the last cell)
+def get_scanned_cell_count(sight: Dict[Direction, list]) -> int:
+    return sum(distance if seen is not None else distance - 1 for distance, seen in sight.values())
+
+
+# statistics over the last window values added, plus the total and number of all values ever added
+class RollingStats:
+    def __init__(self, window: int) -> None:
+        self.values: Deque[float] = deque(maxlen=window)
+        self.total: float = 0
+        self.count: int = 0
+
+    def add(self, value: float) -> None:
+        self.values.append(value)
+        self.total += value
+        self.count += 1
+
+    def get_values(self) -> Dict[str, Optional[float]]:
+        values = list(self.values)
+        return {
+            'last': values[-1] if values else None,
+            'mean': sum(values) / len(values) if values else None,
+            'min': min(values) if values else None,
+            'max': max(values) if values else None,
+            'total': self.total,
+            'count': self.count,
+        }
+
+
+# receives measurements as they are taken. subclasses override the methods they are interested in
+class InstrumentationListener:
+    def on_phase(self, turn: int, phase: str, seconds: float) -> None:
+        pass
+
+    def on_turn(self, turn: int, seconds: float, counts: Dict[str, int]) -> None:
+        pass
+
+
+# measures the turns of a simulation it is passed to: the time of each phase of do_one_turn and of the whole turn,
+# and per turn counts of what the simulation did (see COUNTERS). simulations only call into it when they have one,
+# so without instrumentation all that is left is a None check at each place that would measure something. the stats
+# can be read from another thread while the simulation runs
+class Instrumentation:
+    def __init__(self, window: int = 100, listeners: Optional[List[InstrumentationListener]] = None) -> None:
+        self.window: int = window
+        self.listeners: List[InstrumentationListener] = list(listeners or [])
+        self.phase_stats: Dict[str, RollingStats] = {}
+        self.turn_stats: RollingStats = RollingStats(window)
+        self.counter_stats: Dict[str, RollingStats] = {name: RollingStats(window) for name in COUNTERS}
+        # counts of the turn in progress
+        self.counts: Dict[str, int] = dict.fromkeys(COUNTERS, 0)
+        self.turn: int = 0
+        self.turn_start: float = 0
+        self.lock: Lock = Lock()
+
+    def add_listener(self, listener: InstrumentationListener) -> None:
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener: InstrumentationListener) -> None:
+        self.listeners.remove(listener)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        self.counts[name] += amount
+
+    def start_turn(self, turn: int) -> None:
+        self.turn = turn
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.turn_start = time.perf_counter()
+
+    def run_phase(self, phase: str, method: Callable, *args) -> None:
+        start = time.perf_counter()
+        method(*args)
+        seconds = time.perf_counter() - start
+        with self.lock:
+            if phase not in self.phase_stats:
+                self.phase_stats[phase] = RollingStats(self.window)
+            self.phase_stats[phase].add(seconds)
+        for listener in self.listeners:
+            listener.on_phase(self.turn, phase, seconds)
+
+    def end_turn(self) -> None:
+        seconds = time.perf_counter() - self.turn_start
+        with self.lock:
+            self.turn_stats.add(seconds)
+            for name, value in self.counts.items():
+                self.counter_stats[name].add(value)
+        for listener in self.listeners:
+            listener.on_turn(self.turn, seconds, self.counts)
+
+    # seconds per phase
+    def get_phase_stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        with self.lock:
+            return {phase: stats.get_values() for phase, stats in self.phase_stats.items()}
+
+    # seconds per turn
+    def get_turn_stats(self) -> Dict[str, Optional[float]]:
+        with self.lock:
+            return self.turn_stats.get_values()
+
+    # counts per turn
+    def get_counter_stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        with self.lock:
+            return {name: stats.get_values() for name, stats in self.counter_stats.items()}
@@ -0,0 +1,166 @@
+import json
+import os
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from organisms.evolving_organism import EvolvingOrganism
+
+# columns of each table of a lineage, maps column name to the array typecode it is buffered and stored as
+BIRTH_COLUMNS: Dict[str, str] = {
+    'id': 'q', 'parent_id': 'q', 'turn': 'q', 'sight': 'i', 'speed': 'i', 'size': 'i', 'is_aggressive': 'B',
+    'red': 'B', 'green': 'B', 'blue': 'B',
+}
+DEATH_COLUMNS: Dict[str, str] = {'id': 'q', 'turn': 'q', 'cause': 'B'}
+TABLES: Dict[str, Dict[str, str]] = {'births': BIRTH_COLUMNS, 'deaths': DEATH_COLUMNS}
+# stored in the cause column as the index in this list
+DEATH_CAUSES: List[str] = ['starvation', 'old_age', 'eaten']
+# parent_id of organisms that were spawned rather than born
+NO_PARENT = -1
+# file describing the columns of a lineage directory, next to one file per column
+LINEAGE_HEADER = 'lineage.json'
+
+
+def get_column_path(path: str, table: str, column: str) -> str:
+    return os.path.join(path, f'{table}.{column}.bin')
+
+
+# records the births and deaths of EvolvingOrganisms into the directory path. each column of each table is its own
+# file of little endian values that only ever grows, so a lineage can be read while a run is still appending to it and
+# each column can be memory mapped as a numpy array (see LineageReader). rows are buffered in memory and written
+# buffer_size at a time. with append the records are added to an existing lineage, for continuing a run from a
+# checkpoint
+class LineageRecorder:
+    def __init__(self, path: str, buffer_size: int = 10000, append: bool = False) -> None:
+        self.path: str = path
+        self.buffer_size: int = buffer_size
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, LINEAGE_HEADER), 'w') as file:
+            json.dump({'tables': TABLES, 'death_causes': DEATH_CAUSES}, file)
+        mode = 'ab' if append else 'wb'
+        self.files = {table: {column: open(get_column_path(path, table, column), mode) for column in columns}
+                      for table, columns in TABLES.items()}
+        self.buffers: Dict[str, Dict[str, array]] = {}
+        self.clear_buffers()
+
+    def __enter__(self) -> 'LineageRecorder':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def clear_buffers(self) -> None:
+        self.buffers = {table: {column: array(typecode) for column, typecode in columns.items()}
+                        for table, columns in TABLES.items()}
+
+    # the turn of a birth is the organism's birth_turn, so spawned and born organisms count their lifespans alike
+    def record_birth(self, organism: EvolvingOrganism, parent_id: int) -> None:
+        births = self.buffers['births']
+        births['id'].append(organism.entity_id)
+        births['parent_id'].append(parent_id)
+        births['turn'].append(organism.birth_turn)
+        births['sight'].append(organism.sight)
+        births['speed'].append(organism.speed)
+        births['size'].append(organism.size)
+        births['is_aggressive'].append(organism.is_aggressive)
+        births['red'].append(organism.color[0])
+        births['green'].append(organism.color[1])
+        births['blue'].append(organism.color[2])
+        if len(births['id']) >= self.buffer_size:
+            self.flush()
+
+    def record_death(self, organism: EvolvingOrganism, turn: int, cause: str) -> None:
+        deaths = self.buffers['deaths']
+        deaths['id'].append(organism.entity_id)
+        deaths['turn'].append(turn)
+        deaths['cause'].append(DEATH_CAUSES.index(cause))
+        if len(deaths['id']) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        for table, columns in self.buffers.items():
+            for column, values in columns.items():
+                if sys.byteorder == 'big':
+                    values.byteswap()
+                values.tofile(self.files[table][column])
+                self.files[table][column].flush()
+        self.clear_buffers()
+
+    def close(self) -> None:
+        self.flush()
+        for columns in self.files.values():
+            for file in columns.values():
+                file.close()
+
+
+# the births and deaths of a lineage directory as memory mapped numpy arrays, births[column] and deaths[column]. a
+# table's length is that of its shortest column, so rows a recorder is still writing are left out
+class LineageReader:
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        with open(os.path.join(path, LINEAGE_HEADER)) as file:
+            header = json.load(file)
+        self.death_causes: List[str] = header['death_causes']
+        tables = {table: self.read_table(table, columns) for table, columns in header['tables'].items()}
+        self.births: Dict[str, np.ndarray] = tables['births']
+        self.deaths: Dict[str, np.ndarray] = tables['deaths']
+        # rows of births sorted by id, for looking up organisms by id. ids are given out in increasing order, so the
+        # rows are usually sorted already
+        ids = self.births['id']
+        self.birth_order: Optional[np.ndarray] = None if np.all(ids[1:] > ids[:-1]) else np.argsort(ids, kind='stable')
+        self.sorted_ids: np.ndarray = ids if self.birth_order is None else ids[self.birth_order]
+
+    def read_table(self, table: str, columns: Dict[str, str]) -> Dict[str, np.ndarray]:
+        # numpy shares the typecodes of array
+        dtypes = {column: np.dtype(f'<{typecode}') for column, typecode in columns.items()}
+        length = min(os.path.getsize(get_column_path(self.path, table, column)) // dtype.itemsize
+                     for column, dtype in dtypes.items())
+        return {column: np.memmap(get_column_path(self.path, table, column), dtype=dtype, mode='r', shape=(length,))
+                if length > 0 else np.empty(0, dtype=dtype) for column, dtype in dtypes.items()}
+
+    def __len__(self) -> int:
+        return len(self.births['id'])
+
+    # rows of births of the organisms with the given ids, -1 for ids that were never recorded
+    def get_birth_rows(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        if len(self) == 0:
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, ids), len(self) - 1)
+        rows = positions if self.birth_order is None else self.birth_order[positions]
+        return np.where(self.sorted_ids[positions] == ids, rows, -1)
+
+    # the ids of the organism, its parent, its grandparent and so on up to the organism that was spawned
+    def get_ancestry(self, organism_id: int) -> List[int]:
+        ancestry = []
+        row = int(self.get_birth_rows([organism_id])[0])
+        while row >= 0:
+            ancestry.append(int(self.births['id'][row]))
+            parent_id = int(self.births['parent_id'][row])
+            row = int(self.get_birth_rows([parent_id])[0]) if parent_id != NO_PARENT else -1
+        return ancestry
+
+    def get_children(self, organism_id: int) -> np.ndarray:
+        return np.asarray(self.births['id'][self.births['parent_id'] == organism_id])
+
+    # the mean of a birth column over the organisms born in each turn_bin turns, as (first turn of each bin, mean).
+    # bins without births are left out
+    def get_trait_over_time(self, trait: str, turn_bin: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        bins = np.asarray(self.births['turn']) // turn_bin
+        counts = np.bincount(bins)
+        totals = np.bincount(bins, weights=np.asarray(self.births[trait], dtype=np.float64))
+        has_births = counts > 0
+        return np.flatnonzero(has_births) * turn_bin, totals[has_births] / counts[has_births]
+
+    # turns from the birth turn of each organism that died to the turn it died in, in the order of deaths. an organism
+    # that dies of old age lived max_age - 1 turns, whether it was spawned or born
+    def get_lifespans(self) -> np.ndarray:
+        rows = self.get_birth_rows(self.deaths['id'])
+        known = rows >= 0
+        return np.asarray(self.deaths['turn'])[known] - np.asarray(self.births['turn'])[rows[known]]
+
+    def get_death_cause_counts(self) -> Dict[str, int]:
+        counts = np.bincount(np.asarray(self.deaths['cause']), minlength=len(self.death_causes))
+        return dict(zip(self.death_causes, counts.tolist()))
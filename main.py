@@ -1,11 +1,16 @@
 from evolution_simulation import EvolutionSimulation
 from simulation import Simulation
+from tiled_evolution_simulation import TiledEvolutionSimulation
+from metrics import MetricsRecorder, StdoutSink
 
 
 def main() -> None:
-    s: EvolutionSimulation = EvolutionSimulation()
+    s: EvolutionSimulation = EvolutionSimulation(metrics_recorder=MetricsRecorder([StdoutSink()]))
     # s: Simulation = Simulation()
     s.run()
+    # the tiled simulation steps its tiles in worker processes, which are stopped when the with block is left
+    # with TiledEvolutionSimulation(metrics_recorder=MetricsRecorder([StdoutSink()])) as s:
+    #     s.run()
 
 
 main()
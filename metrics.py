@@ -0,0 +1,194 @@
+import csv
+import json
+import struct
+import sys
+from abc import ABC, abstractmethod
+from array import array
+from typing import Dict, List, Optional
+
+from entity import Entity
+
+# values reported for every sample, in the order they are written
+METRIC_NAMES: List[str] = ['population', 'average_speed', 'average_sight', 'average_size', 'average_red',
+                           'average_green', 'average_blue', 'total_aggressive', 'total_non_aggressive']
+# first bytes of a file written by ColumnarSink
+COLUMNAR_MAGIC = b'EVOCOL1\n'
+
+
+# running totals of EvolvingOrganism traits. organisms are added when they spawn and removed when they die, so the
+# averages are available at any time without walking the population. traits never change after birth, so mutations
+# are accounted for when the offspring is added
+class PopulationMetrics:
+    def __init__(self) -> None:
+        self.population: int = 0
+        self.total_speed: int = 0
+        self.total_sight: int = 0
+        self.total_size: int = 0
+        self.total_red: int = 0
+        self.total_green: int = 0
+        self.total_blue: int = 0
+        self.total_aggressive: int = 0
+
+    def add(self, organism: Entity) -> None:
+        self.__update(organism, 1)
+
+    def remove(self, organism: Entity) -> None:
+        self.__update(organism, -1)
+
+    def __update(self, organism: Entity, sign: int) -> None:
+        self.population += sign
+        self.total_speed += sign * organism.speed
+        self.total_sight += sign * organism.sight
+        self.total_size += sign * organism.size
+        self.total_red += sign * organism.color[0]
+        self.total_green += sign * organism.color[1]
+        self.total_blue += sign * organism.color[2]
+        self.total_aggressive += sign * organism.is_aggressive
+
+    def get_values(self) -> Dict[str, Optional[float]]:
+        count = self.population
+        return {
+            'population': count,
+            'average_speed': self.total_speed / count if count else None,
+            'average_sight': self.total_sight / count if count else None,
+            'average_size': self.total_size / count if count else None,
+            'average_red': self.total_red / count if count else None,
+            'average_green': self.total_green / count if count else None,
+            'average_blue': self.total_blue / count if count else None,
+            'total_aggressive': self.total_aggressive,
+            'total_non_aggressive': count - self.total_aggressive,
+        }
+
+
+class MetricsSink(ABC):
+    @abstractmethod
+    def write(self, turn: int, values: Dict[str, Optional[float]]) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+# prints the same report EvolutionSimulation used to print every turn
+class StdoutSink(MetricsSink):
+    def write(self, turn: int, values: Dict[str, Optional[float]]) -> None:
+        print(f'AVERAGE SPEED: {values["average_speed"]}')
+        print(f'AVERAGE SIGHT: {values["average_sight"]}')
+        print(f'AVERAGE RED: {values["average_red"]}')
+        print(f'AVERAGE GREEN: {values["average_green"]}')
+        print(f'AVERAGE BLUE: {values["average_blue"]}')
+        print(f'AVERAGE SIZE: {values["average_size"]}')
+        print(f'TOTAL AGGRESSIVE: {values["total_aggressive"]}')
+        print(f'TOTAL NON AGGRESSIVE: {values["total_non_aggressive"]}')
+        print()
+
+
+# collects rows in memory and writes them to path buffer_size rows at a time
+class BufferedFileSink(MetricsSink):
+    def __init__(self, path: str, buffer_size: int = 1000) -> None:
+        self.path: str = path
+        self.buffer_size: int = buffer_size
+        self.rows: List[Dict[str, Optional[float]]] = []
+        self.file = self.open()
+
+    @abstractmethod
+    def open(self):
+        pass
+
+    @abstractmethod
+    def write_rows(self, rows: List[Dict[str, Optional[float]]]) -> None:
+        pass
+
+    def write(self, turn: int, values: Dict[str, Optional[float]]) -> None:
+        self.rows.append({'turn': turn, **values})
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.rows:
+            self.write_rows(self.rows)
+            self.rows = []
+        self.file.flush()
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+class CSVSink(BufferedFileSink):
+    def open(self):
+        file = open(self.path, 'w', newline='')
+        self.writer = csv.DictWriter(file, fieldnames=['turn'] + METRIC_NAMES)
+        self.writer.writeheader()
+        return file
+
+    def write_rows(self, rows: List[Dict[str, Optional[float]]]) -> None:
+        self.writer.writerows(rows)
+
+
+class JSONLinesSink(BufferedFileSink):
+    def open(self):
+        return open(self.path, 'w')
+
+    def write_rows(self, rows: List[Dict[str, Optional[float]]]) -> None:
+        self.file.write(''.join(json.dumps(row) + '\n' for row in rows))
+
+
+# binary file made of blocks, each holding the row count followed by one little endian float64 array per column (turn
+# first, then METRIC_NAMES). missing values are stored as NaN. read it back with read_columnar
+class ColumnarSink(BufferedFileSink):
+    def open(self):
+        file = open(self.path, 'wb')
+        file.write(COLUMNAR_MAGIC)
+        header = json.dumps(['turn'] + METRIC_NAMES).encode()
+        file.write(struct.pack('<I', len(header)) + header)
+        return file
+
+    def write_rows(self, rows: List[Dict[str, Optional[float]]]) -> None:
+        self.file.write(struct.pack('<I', len(rows)))
+        for name in ['turn'] + METRIC_NAMES:
+            column = array('d', (float('nan') if row[name] is None else row[name] for row in rows))
+            if sys.byteorder == 'big':
+                column.byteswap()
+            column.tofile(self.file)
+
+
+def read_columnar(path: str) -> Dict[str, List[float]]:
+    with open(path, 'rb') as file:
+        if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f'{path} is not a columnar metrics file')
+        header_length, = struct.unpack('<I', file.read(4))
+        names = json.loads(file.read(header_length))
+        columns: Dict[str, List[float]] = {name: [] for name in names}
+        while True:
+            block_header = file.read(4)
+            if len(block_header) < 4:
+                return columns
+            row_count, = struct.unpack('<I', block_header)
+            for name in names:
+                column = array('d')
+                column.frombytes(file.read(8 * row_count))
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                columns[name].extend(column)
+
+
+# hands the metrics of every interval-th turn to each sink
+class MetricsRecorder:
+    def __init__(self, sinks: List[MetricsSink], interval: int = 1) -> None:
+        self.sinks: List[MetricsSink] = sinks
+        self.interval: int = interval
+
+    def should_record(self, turn: int) -> bool:
+        return turn % self.interval == 0
+
+    def record(self, turn: int, values: Dict[str, Optional[float]]) -> None:
+        for sink in self.sinks:
+            sink.write(turn, values)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
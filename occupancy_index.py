@@ -0,0 +1,58 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, List, Optional, Tuple
+
+from direction import Direction
+
+
+# keeps the occupied x positions of every row and the occupied y positions of every column in sorted lists, so the
+# nearest occupied cell in a direction can be found with a binary search instead of walking the habitat cell by cell
+class OccupancyIndex:
+    def __init__(self) -> None:
+        # how many entities are in each occupied cell, a cell is in the rows and columns while this is above 0
+        self.__counts: Dict[Tuple[int, int], int] = {}
+        self.__rows: Dict[int, List[int]] = {}
+        self.__columns: Dict[int, List[int]] = {}
+
+    def add(self, x: int, y: int) -> None:
+        count = self.__counts.get((x, y), 0)
+        self.__counts[(x, y)] = count + 1
+        if count == 0:
+            insort(self.__rows.setdefault(y, []), x)
+            insort(self.__columns.setdefault(x, []), y)
+
+    def remove(self, x: int, y: int) -> None:
+        count = self.__counts[(x, y)] - 1
+        if count > 0:
+            self.__counts[(x, y)] = count
+            return
+        del self.__counts[(x, y)]
+        row = self.__rows[y]
+        del row[bisect_left(row, x)]
+        column = self.__columns[x]
+        del column[bisect_left(column, y)]
+
+    def move(self, from_x: int, from_y: int, to_x: int, to_y: int) -> None:
+        self.remove(from_x, from_y)
+        self.add(to_x, to_y)
+
+    def is_occupied(self, x: int, y: int) -> bool:
+        return (x, y) in self.__counts
+
+    # distance from (x, y) to the nearest occupied cell in direction, or None if there is none or it is further away
+    # than limit
+    def get_distance(self, x: int, y: int, direction: Direction, limit: Optional[int] = None) -> Optional[int]:
+        if direction == Direction.NORTH or direction == Direction.SOUTH:
+            positions = self.__columns.get(x, [])
+            start = y
+        else:
+            positions = self.__rows.get(y, [])
+            start = x
+        if direction == Direction.NORTH or direction == Direction.WEST:
+            i = bisect_left(positions, start) - 1
+            distance = start - positions[i] if i >= 0 else None
+        else:
+            i = bisect_right(positions, start)
+            distance = positions[i] - start if i < len(positions) else None
+        if distance is None or (limit is not None and distance > limit):
+            return None
+        return distance
@@ -0,0 +1,32 @@
+from abc import ABC, abstractmethod
+from random import Random
+from typing import Dict, List, Optional
+
+from direction import Direction
+
+
+# how an organism type decides its moves, mixed into an Organism. Simulation asks each organism type for the moves of
+# all of its organisms in one get_moves call, and only computes the sight of the organisms of types whose needs_sight
+# is set. sights holds None for each organism of the other types. a type may override get_moves with a vectorized
+# version, which must draw from rng exactly as get_move would for each organism in turn, so seeded runs stay the same
+class MovementStrategy(ABC):
+    __slots__ = ()
+    needs_sight: bool = False
+
+    @abstractmethod
+    def get_move(self, possible_directions: List[Direction], sight: Optional[Dict[Direction, list]],
+                 rng: Random, turn: int) -> Optional[Direction]:
+        pass
+
+    @classmethod
+    def get_moves(cls, organisms: List['MovementStrategy'], possible_directions: List[List[Direction]],
+                  sights: List[Optional[Dict[Direction, list]]], rng: Random,
+                  turn: int) -> List[Optional[Direction]]:
+        return [organism.get_move(directions, sight, rng, turn)
+                for organism, directions, sight in zip(organisms, possible_directions, sights)]
+
+    # called instead of making the move get_move chose when its cell was taken in the meantime, the organism pays for
+    # staying instead of for moving
+    def cancel_move(self) -> None:
+        self.food_count += self.config.move_cost
+        self.food_count -= self.config.cost_to_live
@@ -0,0 +1,59 @@
+from typing import Dict, Iterable, List, Tuple
+
+from entity import Entity
+from entity_store import EntityStore
+from config import SimulationConfig, DEFAULT_CONFIG
+import constants
+
+
+# what every kind of organism has: food, the config of its simulation and the turn it was born in, which its age is
+# counted from
+class Organism(Entity):
+    __slots__ = ('config', 'food_count', 'birth_turn', 'max_age')
+
+    def __init__(self, x: int, y: int, color: Tuple[int, int, int], config: SimulationConfig = DEFAULT_CONFIG,
+                 birth_turn: int = 0) -> None:
+        super().__init__(x, y, constants.ORGANISM_ID, color)
+        self.config: SimulationConfig = config
+        self.food_count: float = self.config.start_food
+        # the turn of the first aging check the organism goes through, its age is the number of checks it went through
+        self.birth_turn: int = birth_turn
+        self.max_age = self.config.max_age
+
+    def get_age(self, turn: int) -> int:
+        return turn - self.birth_turn
+
+    # the turn whose aging check the organism does not survive
+    def get_death_turn(self) -> int:
+        return self.birth_turn + self.max_age - 1
+
+    def get_no_move_probability(self, turn: int) -> float:
+        return self.get_age(turn) / self.max_age
+
+    # old age is up to the simulation, see get_death_turn
+    def is_present(self) -> bool:
+        return self.food_count > 0
+
+
+# organisms by the turn they die of old age in, and organisms whose food ran out since the last aging check, so that an
+# aging check only looks at those instead of every entity. organisms that died some other way are only dropped from the
+# calendar when their turn comes
+class AgingSchedule:
+    def __init__(self) -> None:
+        self.expiry_calendar: Dict[int, List[Organism]] = {}
+        self.starving: List[Organism] = []
+
+    def add(self, organism: Organism) -> None:
+        self.expiry_calendar.setdefault(organism.get_death_turn(), []).append(organism)
+        self.add_starving([organism])
+
+    # the given organisms whose food ran out
+    def add_starving(self, organisms: Iterable[Organism]) -> None:
+        self.starving.extend(organism for organism in organisms if organism.food_count <= 0)
+
+    # the organisms still in entities that may die in the aging check of turn, in the order of their ids
+    def pop_due(self, turn: int, entities: EntityStore) -> List[Organism]:
+        candidates = self.expiry_calendar.pop(turn, []) + self.starving
+        self.starving = []
+        due = {organism.entity_id: organism for organism in candidates if organism in entities}
+        return [due[entity_id] for entity_id in sorted(due)]
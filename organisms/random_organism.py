@@ -1,41 +1,36 @@
 from typing import Tuple, Optional, List, Dict
-from random import choice, random
+from random import Random
 
 from direction import Direction
 from entity import Entity
+from organisms.organism import Organism
+from organisms.movement_strategy import MovementStrategy
+from config import SimulationConfig, DEFAULT_CONFIG
 import constants
 
 
-class RandomOrganism(Entity):
-    def __init__(self, x: int, y: int, color: Tuple[int, int, int] = constants.BLUE) -> None:
-        super().__init__(x, y, constants.ORGANISM_ID, color)
-        self.food_count: float = constants.START_FOOD
-        self.age = 0
-        self.max_age = constants.MAX_AGE
+class RandomOrganism(Organism, MovementStrategy):
+    __slots__ = ()
 
-    def get_no_move_probability(self) -> float:
-        return self.age / self.max_age
+    def __init__(self, x: int, y: int, color: Tuple[int, int, int] = constants.BLUE,
+                 config: SimulationConfig = DEFAULT_CONFIG, birth_turn: int = 0) -> None:
+        super().__init__(x, y, color, config, birth_turn)
 
-    def get_move(self, possible_directions: List[Direction], sight: Dict[Direction, list]) -> Optional[Direction]:
-        if possible_directions == [] or random() < self.get_no_move_probability():
-            self.food_count -= constants.COST_TO_LIVE
+    def get_move(self, possible_directions: List[Direction], sight: Dict[Direction, list], rng: Random,
+                 turn: int) -> Optional[Direction]:
+        if possible_directions == [] or rng.random() < self.get_no_move_probability(turn):
+            self.food_count -= self.config.cost_to_live
             return None
-        self.food_count -= constants.MOVE_COST
-        return choice(possible_directions)
+        self.food_count -= self.config.move_cost
+        return rng.choice(possible_directions)
 
     def collide(self, other: Entity) -> bool:
         if other.mask_id == constants.FOOD_ID:
             self.food_count += 1
         return True
 
-    def is_present(self) -> bool:
-        self.age += 1
-        if self.age == self.max_age:
-            return False
-        return self.food_count > 0
-
     def should_reproduce(self) -> bool:
-        if self.food_count > constants.REPRODUCTION_COST:
-            self.food_count = constants.START_FOOD
+        if self.food_count > self.config.reproduction_cost:
+            self.food_count = self.config.start_food
             return True
         return False
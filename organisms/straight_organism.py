@@ -1,30 +1,31 @@
 from typing import Tuple, Optional, List, Dict
-from random import choice, random
+from random import Random
 
 from direction import Direction
 from entity import Entity
+from organisms.organism import Organism
+from organisms.movement_strategy import MovementStrategy
+from config import SimulationConfig, DEFAULT_CONFIG
 import constants
 
 
-class StraightOrganism(Entity):
-    def __init__(self, x: int, y: int, color: Tuple[int, int, int] = constants.RED) -> None:
-        super().__init__(x, y, constants.ORGANISM_ID, color)
-        self.food_count: float = constants.START_FOOD
-        self.age = 0
-        self.max_age = constants.MAX_AGE
-        self.current_move = Direction.NORTH
+class StraightOrganism(Organism, MovementStrategy):
+    __slots__ = ('current_move')
 
-    def get_no_move_probability(self) -> float:
-        return self.age / self.max_age
+    def __init__(self, x: int, y: int, color: Tuple[int, int, int] = constants.RED,
+                 config: SimulationConfig = DEFAULT_CONFIG, birth_turn: int = 0) -> None:
+        super().__init__(x, y, color, config, birth_turn)
+        self.current_move = Direction.NORTH
 
-    def get_move(self, possible_directions: List[Direction], sight: Dict[Direction, list]) -> Optional[Direction]:
-        if possible_directions == [] or random() < self.get_no_move_probability():
-            self.food_count -= constants.COST_TO_LIVE
+    def get_move(self, possible_directions: List[Direction], sight: Dict[Direction, list], rng: Random,
+                 turn: int) -> Optional[Direction]:
+        if possible_directions == [] or rng.random() < self.get_no_move_probability(turn):
+            self.food_count -= self.config.cost_to_live
             return None
-        self.food_count -= constants.MOVE_COST
+        self.food_count -= self.config.move_cost
         if self.current_move in possible_directions:
             return self.current_move
-        move = choice(possible_directions)
+        move = rng.choice(possible_directions)
         self.current_move = move
         return move
 
@@ -33,14 +34,8 @@ class StraightOrganism(Entity):
             self.food_count += 1
         return True
 
-    def is_present(self) -> bool:
-        self.age += 1
-        if self.age == self.max_age:
-            return False
-        return self.food_count > 0
-
     def should_reproduce(self) -> bool:
-        if self.food_count > constants.REPRODUCTION_COST:
-            self.food_count = constants.START_FOOD
+        if self.food_count > self.config.reproduction_cost:
+            self.food_count = self.config.start_food
             return True
         return False
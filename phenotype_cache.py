@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from math import sqrt
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import constants
+
+MAX_COLOR_DISTANCE: float = sqrt((255 ** 2) * 3)
+
+
+# the values of the max_size keys looked up most recently, the least recently used one is dropped when there are too
+# many
+class LruCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size: int = max_size
+        self.values: OrderedDict = OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    # None if key is not cached
+    def get(self, key: Hashable):
+        value = self.values.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.values.move_to_end(key)
+        return value
+
+    def add(self, key: Hashable, value) -> None:
+        self.values[key] = value
+        if len(self.values) > self.max_size:
+            self.values.popitem(last=False)
+            self.evictions += 1
+
+    def get_stats(self) -> Dict[str, Optional[float]]:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self.values),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else None,
+        }
+
+    def clear(self) -> None:
+        self.values.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+
+# the color score EvolvingOrganism gives to a seen color, which only depends on its aggressiveness
+def get_color_score(color: Tuple[int, int, int], is_aggressive: bool) -> float:
+    red1, green1, blue1 = color
+    red2, green2, blue2 = constants.GREEN
+    color_distance = sqrt((red1 - red2) ** 2 + (green1 - green2) ** 2 + (blue1 - blue2) ** 2)
+    color_score = (color_distance / MAX_COLOR_DISTANCE)
+    if not is_aggressive:
+        color_score = color_score * -1 + 1
+    return color_score
+
+
+# the scores EvolvingOrganism gives to what it sees, for every organism with the same sight and aggressiveness, which
+# are the only parts of the genome the score depends on. the score of a distance and a seen color is the sum of a
+# distance score, precomputed for every distance within sight, and a color score, looked up in color_scores, which
+# every table shares. both are computed with the same arithmetic as before, so scores are the same to the last bit
+class ScoreTable:
+    def __init__(self, sight: int, is_aggressive: bool, color_scores: LruCache) -> None:
+        self.sight: int = sight
+        self.is_aggressive: bool = is_aggressive
+        divisor = sight - 1 if sight > 1 else 1
+        # indexed by distance, distances beyond sight score 0
+        self.distance_scores: List[float] = [((distance - 1) / divisor * -1) + 1 for distance in range(sight + 1)]
+        # by (color, is_aggressive)
+        self.color_scores: LruCache = color_scores
+
+    # color is None when nothing was seen
+    def get_score(self, distance: int, color: Optional[Tuple[int, int, int]]) -> float:
+        if color is None:
+            return 0
+        key = (color, self.is_aggressive)
+        color_score = self.color_scores.get(key)
+        if color_score is None:
+            color_score = get_color_score(color, self.is_aggressive)
+            self.color_scores.add(key, color_score)
+        distance_score = self.distance_scores[distance] if distance <= self.sight else 0
+        return color_score + distance_score
+
+
+# the ScoreTables of the max_size phenotypes used most recently, and the color scores of the max_color_count colors
+# seen most recently. mutations keep producing new phenotypes and colors, so both are bounded
+class PhenotypeCache:
+    def __init__(self, max_size: int = 256, max_color_count: int = 4096) -> None:
+        self.tables: LruCache = LruCache(max_size)
+        self.color_scores: LruCache = LruCache(max_color_count)
+
+    def __len__(self) -> int:
+        return len(self.tables)
+
+    def get_table(self, sight: int, is_aggressive: bool) -> ScoreTable:
+        key = (sight, is_aggressive)
+        table = self.tables.get(key)
+        if table is None:
+            table = ScoreTable(sight, is_aggressive, self.color_scores)
+            self.tables.add(key, table)
+        return table
+
+    # the stats of the tables, followed by those of the color scores with names starting with color_scores_
+    def get_stats(self) -> Dict[str, Optional[float]]:
+        stats = self.tables.get_stats()
+        stats.update({f'color_scores_{name}': value for name, value in self.color_scores.get_stats().items()})
+        return stats
+
+    def clear(self) -> None:
+        self.tables.clear()
+        self.color_scores.clear()
+
+
+# shared by every EvolvingOrganism
+PHENOTYPE_CACHE = PhenotypeCache()
@@ -0,0 +1,173 @@
+from queue import Queue, Empty, Full
+from threading import Thread, Event
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+import pygame
+
+from config import SimulationConfig
+from renderer import Renderer, FULL_RENDER_FRACTION
+
+# what a PipelinedRenderer does with a new frame while its queue is full: 'block' waits for the display thread to make
+# room, 'drop' drops the new frame and 'latest' drops the oldest waiting frame, so the newest state is always shown next
+RENDER_QUEUE_POLICIES: Tuple[str, ...] = ('block', 'drop', 'latest')
+# the longest the display thread goes without handling the events of the window, in seconds
+EVENT_INTERVAL = 0.02
+
+
+# draws the frames of a simulation on a display thread of its own, so that the simulation does not wait for drawing and
+# updating the window. the simulation publishes each frame as a color array into a queue of up to queue_size frames,
+# and policy decides what happens to frames the display thread is too slow for. the display thread creates the window,
+# draws every frame it takes from the queue with a Renderer, redrawing only the cells that changed since the frame it
+# drew before, and handles the events of the window even while no frames arrive. closing the window raises SystemExit
+# in the simulation's thread at its next frame. some platforms only allow windows on the main thread, use the inline
+# Renderer there
+class PipelinedRenderer:
+    def __init__(self, block_width: int, board_size: int, policy: str = 'latest', queue_size: int = 2) -> None:
+        if policy not in RENDER_QUEUE_POLICIES:
+            raise ValueError(f'unknown render queue policy: {policy}')
+        self.block_width: int = block_width
+        self.board_size: int = board_size
+        self.policy: str = policy
+        self.frames: Queue = Queue(queue_size)
+        self.published_count: int = 0
+        self.dropped_count: int = 0
+        self.displayed_count: int = 0
+        # the last frame handed to the display thread, which frames of changed cells are applied to
+        self.published: Optional[np.ndarray] = None
+        self.window_closed: bool = False
+        self.stopping: Event = Event()
+        # the first exception raised on the display thread stops it, and is raised once in the simulation's thread
+        self.error: Optional[BaseException] = None
+        self.thread: Thread = Thread(target=self.display_frames, daemon=True)
+        self.thread.start()
+
+    def __enter__(self) -> 'PipelinedRenderer':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    # true if a frame with changed_count changed cells should be handed over with render_array instead of render_cells
+    def should_render_fully(self, changed_count: int) -> bool:
+        return self.published is None or changed_count > self.board_size ** 2 * FULL_RENDER_FRACTION
+
+    # makes the next frame hand over the whole board, for when the board was replaced as a whole
+    def request_full_render(self) -> None:
+        self.published = None
+
+    def render(self, board: List[List[Tuple[int, int, int]]]) -> None:
+        self.render_array(np.array(board, dtype=np.uint8))
+
+    # cells maps (x, y) to the new color of that cell. the frame is the last one with those cells changed, so that the
+    # simulation only pays for the cells that changed
+    def render_cells(self, cells: Dict[Tuple[int, int], Tuple[int, int, int]]) -> None:
+        colors = self.published.copy()
+        if cells:
+            x, y = np.array(list(cells.keys()), dtype=np.intp).T
+            colors[y, x] = np.array(list(cells.values()), dtype=np.uint8)
+        self.render_array(colors)
+
+    # colors is a board_size x board_size x 3 array indexed by [y][x]. it is made read only, as the display thread may
+    # draw it at any time after
+    def render_array(self, colors: np.ndarray) -> None:
+        self.raise_error()
+        if self.window_closed:
+            raise SystemExit('the window was closed')
+        colors.flags.writeable = False
+        self.published = colors
+        self.published_count += 1
+        if self.policy == 'block':
+            self.put_waiting(colors)
+        elif self.policy == 'drop':
+            self.put_or_drop(colors)
+        else:
+            self.put_replacing_oldest(colors)
+
+    # waits while the display thread is alive, so that a stopped display thread never blocks the simulation
+    def put_waiting(self, colors: np.ndarray) -> None:
+        while self.thread.is_alive():
+            try:
+                self.frames.put(colors, timeout=EVENT_INTERVAL)
+                return
+            except Full:
+                pass
+        self.dropped_count += 1
+
+    def put_or_drop(self, colors: np.ndarray) -> None:
+        try:
+            self.frames.put_nowait(colors)
+        except Full:
+            self.dropped_count += 1
+
+    def put_replacing_oldest(self, colors: np.ndarray) -> None:
+        while True:
+            try:
+                self.frames.put_nowait(colors)
+                return
+            except Full:
+                pass
+            # the display thread may have taken the oldest frame in the meantime
+            try:
+                self.frames.get_nowait()
+                self.dropped_count += 1
+            except Empty:
+                pass
+
+    def display_frames(self) -> None:
+        try:
+            renderer = Renderer(self.block_width, self.board_size)
+            shown: Optional[np.ndarray] = None
+            while not self.stopping.is_set():
+                if self.handle_events():
+                    self.window_closed = True
+                    return
+                try:
+                    colors = self.frames.get(timeout=EVENT_INTERVAL)
+                except Empty:
+                    continue
+                self.draw(renderer, colors, shown)
+                shown = colors
+                self.displayed_count += 1
+        except BaseException as error:
+            self.error = error
+        finally:
+            pygame.display.quit()
+
+    # true if the window was closed
+    def handle_events(self) -> bool:
+        return any(event.type == pygame.QUIT for event in pygame.event.get())
+
+    def draw(self, renderer: Renderer, colors: np.ndarray, shown: Optional[np.ndarray]) -> None:
+        if shown is None:
+            renderer.render_array(colors)
+            return
+        changed = np.any(colors != shown, axis=2)
+        changed_count = int(np.count_nonzero(changed))
+        if renderer.should_render_fully(changed_count):
+            renderer.render_array(colors)
+        elif changed_count > 0:
+            changed_y, changed_x = np.nonzero(changed)
+            renderer.render_cells({(x, y): tuple(colors[y, x]) for x, y in zip(changed_x.tolist(), changed_y.tolist())})
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    # stops the display thread and closes the window, frames still waiting in the queue are not drawn
+    def close(self) -> None:
+        self.stopping.set()
+        self.thread.join()
+        self.raise_error()
+
+
+SimulationRenderer = Union[Renderer, PipelinedRenderer]
+
+
+# the renderer a simulation with a window draws its board_size x board_size board with, drawing on the simulation's
+# thread when config.render_queue_policy is 'inline' and on a display thread otherwise
+def get_renderer(config: SimulationConfig, board_size: int) -> SimulationRenderer:
+    if config.render_queue_policy == 'inline':
+        return Renderer(config.block_width, board_size)
+    return PipelinedRenderer(config.block_width, board_size, config.render_queue_policy, config.render_queue_size)
@@ -1,6 +1,11 @@
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+import numpy as np
 import pygame
 
+# when more than this fraction of the cells changed, redrawing the whole surface from a color array is cheaper than
+# drawing the changed cells one by one
+FULL_RENDER_FRACTION = 0.25
+
 
 class Renderer:
     # block_width is how many pixels wide each square is
@@ -8,12 +13,38 @@ class Renderer:
     def __init__(self, block_width: int, board_size: int) -> None:
         pygame.init()
         self.__block_width: int = block_width
+        self.__board_size: int = board_size
         self.__window_width: int = block_width * board_size
         self.__screen = pygame.display.set_mode((self.__window_width, self.__window_width))
+        self.__has_frame: bool = False
 
     def render(self, board: List[List[Tuple[int, int, int]]]) -> None:
         self.__draw_grid(board, self.__block_width)
         pygame.display.update()
+        self.__has_frame = True
+
+    # true if a frame with changed_count changed cells should be drawn with render_array instead of render_cells
+    def should_render_fully(self, changed_count: int) -> bool:
+        return not self.__has_frame or changed_count > self.__board_size ** 2 * FULL_RENDER_FRACTION
+
+    # makes the next frame redraw everything, for when the board was replaced as a whole
+    def request_full_render(self) -> None:
+        self.__has_frame = False
+
+    # cells maps (x, y) to the new color of that cell, only those cells are drawn and updated on the display
+    def render_cells(self, cells: Dict[Tuple[int, int], Tuple[int, int, int]]) -> None:
+        block_width = self.__block_width
+        rectangles = [self.__draw_rectangle(x * block_width, y * block_width, block_width, color)
+                      for (x, y), color in cells.items()]
+        pygame.display.update(rectangles)
+
+    # colors is a board_size x board_size x 3 array indexed by [y][x], blitted to the whole surface at once
+    def render_array(self, colors: np.ndarray) -> None:
+        pixels = np.repeat(np.repeat(colors, self.__block_width, axis=0), self.__block_width, axis=1)
+        # surfarray is indexed by [x][y]
+        pygame.surfarray.blit_array(self.__screen, pixels.transpose(1, 0, 2))
+        pygame.display.update()
+        self.__has_frame = True
 
     def __draw_grid(self, board: List[List[Tuple[int, int, int]]], block_width: int) -> None:
         for i, row in enumerate(board):
@@ -21,6 +52,7 @@ class Renderer:
                 self.__draw_rectangle(i * block_width, j * block_width, block_width, board[j][i])
 
     # x, y are top left corner of rectangle
-    def __draw_rectangle(self, x: int, y: int, width: int, color: Tuple[int, int, int]) -> None:
+    def __draw_rectangle(self, x: int, y: int, width: int, color: Tuple[int, int, int]) -> pygame.Rect:
         rectangle = pygame.draw.rect(self.__screen, (0, 0, 0), pygame.Rect(x, y, width, width), 1)
         pygame.Surface.fill(self.__screen, color, rect=rectangle)
+        return rectangle
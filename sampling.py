@@ -0,0 +1,30 @@
+from math import log1p, log
+from random import Random
+from typing import Iterator
+
+
+# the positions 0 <= i < count that pass a random() < probability roll each, in increasing order, without rolling for
+# every position. the gap between passing positions follows a geometric distribution, so one random number is drawn
+# per position returned and the cost does not depend on count
+def iterate_bernoulli_positions(count: int, probability: float, rng: Random) -> Iterator[int]:
+    if probability <= 0:
+        return
+    if probability >= 1:
+        yield from range(count)
+        return
+    log_miss = log1p(-probability)
+    position = -1
+    while True:
+        # 1 - random() is in (0, 1], so the log is defined
+        position += int(log(1 - rng.random()) / log_miss) + 1
+        if position >= count:
+            return
+        yield position
+
+
+# the number of successes in count trials that each succeed with probability, at the cost of one random number per
+# success, or per failure when failures are the rarer outcome
+def get_binomial_count(count: int, probability: float, rng: Random) -> int:
+    if probability > 0.5:
+        return count - get_binomial_count(count, 1 - probability, rng)
+    return sum(1 for _ in iterate_bernoulli_positions(count, probability, rng))
@@ -1,35 +1,107 @@
-from random import random, shuffle, choice
-from typing import List, Tuple, Dict
-from itertools import combinations
+from random import Random
+from typing import List, Tuple, Dict, Optional, Set, TYPE_CHECKING
+
+import numpy as np
 
 from organisms.sight_organism import SightOrganism
 from organisms.straight_organism import StraightOrganism
-from renderer import Renderer
 from organisms.random_organism import RandomOrganism
+from organisms.organism import AgingSchedule
 from direction import Direction
+from entity_store import EntityStore
+from habitat import BaseHabitat, HABITAT_BACKENDS
+from sampling import get_binomial_count
 from food import Food
 from entity import Entity
+from config import SimulationConfig
+from instrumentation import Instrumentation, get_scanned_cell_count
+import constants
+
+if TYPE_CHECKING:
+    from frame_export import FrameExporter
+    from render_pipeline import SimulationRenderer
+
+# food spawns at half the rate of an EvolutionSimulation
+DEFAULT_SIMULATION_CONFIG = SimulationConfig(food_spawn_probability=0.0005)
 
 
 class Simulation:
-    def __init__(self) -> None:
-        self.habitat_width: int = 200
+    # headless simulations never import pygame, render_interval is how many turns pass between rendered frames.
+    # every random decision is drawn from rng, so a given seed always produces the same sequence of turns.
+    # instrumentation, if given, measures every turn, and frame_exporter, if given, records turns as frames without
+    # needing a window
+    def __init__(self, config: SimulationConfig = DEFAULT_SIMULATION_CONFIG, headless: bool = False,
+                 render_interval: int = 1, seed: Optional[int] = None,
+                 instrumentation: Optional[Instrumentation] = None,
+                 frame_exporter: Optional['FrameExporter'] = None) -> None:
+        self.config: SimulationConfig = config
+        self.habitat_width: int = config.habitat_width
+        self.turn: int = 0
+        self.rng: Random = Random(seed)
+        self.render_interval: int = render_interval
+        self.instrumentation: Optional[Instrumentation] = instrumentation
+        self.frame_exporter: Optional['FrameExporter'] = frame_exporter
         self.organism_types: List[type] = [SightOrganism, RandomOrganism, StraightOrganism]
-        self.entities: List[Entity] = []
-        self.habitat: List[List[List[Entity]]] = self.get_empty_habitat()
-        self.renderer: Renderer = Renderer(6, self.habitat_width)
+        self.entities: EntityStore = EntityStore()
+        self.aging_schedule: AgingSchedule = AgingSchedule()
+        self.renderer: Optional['SimulationRenderer'] = None if headless else self.get_renderer()
+        self.habitat: BaseHabitat = self.get_empty_habitat()
         self.spawn_organisms()
-        self.spawn_food()
-
-    def run(self) -> None:
-        while True:
-            self.renderer.render(self.get_board_for_renderer())
-            self.move_organisms()
-            self.do_collisions()
-            self.check_if_present()
-            self.spawn_food(0.0005)
-            self.do_reproductions()
-            # self.print_organism_counts()
+        self.spawn_food(self.config.initial_food_spawn_probability)
+
+    def get_renderer(self) -> 'SimulationRenderer':
+        # imported here so that pygame is only loaded when a window is actually needed
+        from render_pipeline import get_renderer
+        return get_renderer(self.config, self.habitat_width)
+
+    # runs forever if turns is None, otherwise returns after the given number of turns
+    def run(self, turns: Optional[int] = None) -> None:
+        if turns is None:
+            while True:
+                self.step()
+        for _ in range(turns):
+            self.step()
+
+    def step(self) -> None:
+        if self.should_render():
+            self.render()
+        if self.frame_exporter is not None:
+            self.frame_exporter.on_turn(self)
+        self.do_one_turn()
+        self.turn += 1
+
+    def should_render(self) -> bool:
+        return self.renderer is not None and self.turn % self.render_interval == 0
+
+    # draws only the cells that changed since the last frame, or the whole habitat if too many of them changed
+    def render(self) -> None:
+        dirty_cells = self.habitat.pop_dirty_cells()
+        if self.renderer.should_render_fully(len(dirty_cells)):
+            self.renderer.render_array(self.get_color_array())
+        else:
+            self.renderer.render_cells({(x, y): self.get_cell_color(x, y) for x, y in dirty_cells})
+
+    def do_one_turn(self) -> None:
+        if self.instrumentation is not None:
+            self.do_one_turn_instrumented()
+            return
+        self.move_organisms()
+        self.do_collisions()
+        self.check_if_present()
+        self.spawn_food(self.config.food_spawn_probability)
+        self.do_reproductions()
+        # self.print_organism_counts()
+
+    # do_one_turn with every phase timed
+    def do_one_turn_instrumented(self) -> None:
+        instrumentation = self.instrumentation
+        instrumentation.start_turn(self.turn)
+        instrumentation.run_phase('move_organisms', self.move_organisms)
+        instrumentation.run_phase('do_collisions', self.do_collisions)
+        instrumentation.run_phase('check_if_present', self.check_if_present)
+        instrumentation.run_phase('spawn_food', self.spawn_food, self.config.food_spawn_probability)
+        instrumentation.run_phase('do_reproductions', self.do_reproductions)
+        instrumentation.end_turn()
 
     def print_organism_counts(self):
         for o_type in self.organism_types:
@@ -44,22 +116,30 @@ class Simulation:
         return count
 
     def kill_entity(self, entity: Entity, x: int, y: int):
-        self.habitat[y][x].remove(entity)
+        self.habitat.remove(entity, x, y)
         self.entities.remove(entity)
-
-    def do_collision(self, a: Entity, b: Entity, x: int, y: int):
-        a_survives, b_survives = a.collide(b), b.collide(a)
-        if not a_survives:
-            self.kill_entity(a, x, y)
-        if not b_survives:
-            self.kill_entity(b, x, y)
+        if self.instrumentation is not None and entity.mask_id == constants.ORGANISM_ID:
+            self.instrumentation.count('deaths')
 
     def do_collisions(self):
-        for y in range(self.habitat_width):
-            for x in range(self.habitat_width):
-                if len(self.habitat[y][x]) > 1:
-                    for pair in combinations(self.habitat[y][x], 2):
-                        self.do_collision(pair[0], pair[1], x, y)
+        for x, y in self.habitat.pop_contested_cells():
+            cell = self.habitat.get_cell(x, y)
+            if len(cell) > 1:
+                self.do_cell_collisions(x, y, list(cell))
+
+    # resolves the cell in one pass: the first organism in the cell eats all of its food, and organisms leave each
+    # other alone. moves and spawns never put food on food, so colliding every pair in the order of
+    # combinations(cell, 2) comes to the same
+    def do_cell_collisions(self, x: int, y: int, cell: List[Entity]) -> None:
+        organisms = [entity for entity in cell if entity.mask_id == constants.ORGANISM_ID]
+        if not organisms:
+            return
+        food = [entity for entity in cell if entity.mask_id == constants.FOOD_ID]
+        if self.instrumentation is not None:
+            self.instrumentation.count('collisions', len(food))
+        for entity in food:
+            organisms[0].collide(entity)
+            self.kill_entity(entity, x, y)
 
     def do_reproductions(self):
         for entity in self.entities:
@@ -67,55 +147,98 @@ class Simulation:
                 if entity.should_reproduce():
                     possible_directions = self.get_possible_directions(entity)
                     if possible_directions != []:
-                        delta_x, delta_y = choice(possible_directions).value
+                        delta_x, delta_y = self.rng.choice(possible_directions).value
                         x = entity.x + delta_x
                         y = entity.y + delta_y
-                        new_organism = type(entity)(x, y)
+                        # born after this turn's aging check
+                        new_organism = type(entity)(x, y, config=self.config, birth_turn=self.turn + 1)
                         self.spawn_entity(new_organism, x, y)
+                        if self.instrumentation is not None:
+                            self.instrumentation.count('births')
 
+    # the aging check, see AgingSchedule
     def check_if_present(self):
-        for y in range(self.habitat_width):
-            for x in range(self.habitat_width):
-                for entity in self.habitat[y][x]:
-                    if not entity.is_present():
-                        self.kill_entity(entity, x, y)
+        for organism in self.aging_schedule.pop_due(self.turn, self.entities):
+            if organism.get_death_turn() == self.turn or not organism.is_present():
+                self.kill_entity(organism, organism.x, organism.y)
 
     def move_organism(self, organism: RandomOrganism, direction: Direction) -> None:
         if direction is not None:
-            self.habitat[organism.y][organism.x].remove(organism)
             delta_x, delta_y = direction.value
+            self.habitat.move(organism, organism.x, organism.y, organism.x + delta_x, organism.y + delta_y)
             organism.x += delta_x
             organism.y += delta_y
-            self.habitat[organism.y][organism.x].append(organism)
 
+    # every organism decides its move from the habitat as it was at the start of the turn, with one get_moves call per
+    # organism type, and sight is only looked up for the types that need it. the moves are then made in the shuffled
+    # order, and a move into a cell another organism has moved into in the meantime is cancelled
     def move_organisms(self) -> None:
         # shuffle organisms, so first organisms don't always have an advantage of getting a desirable spot
-        shuffle(self.entities)
-        for entity in self.entities:
-            if self.is_organism(entity):
-                move = entity.get_move(self.get_possible_directions(entity), self.get_sight(entity))
-                self.move_organism(entity, move)
+        self.entities.shuffle(self.rng.shuffle)
+        organisms = [entity for entity in self.entities if entity.mask_id == constants.ORGANISM_ID]
+        if self.instrumentation is not None:
+            self.instrumentation.count('entities_visited', len(organisms))
+        organism_cells = {(organism.x, organism.y) for organism in organisms}
+        members: Dict[type, List[int]] = {}
+        for i, organism in enumerate(organisms):
+            members.setdefault(type(organism), []).append(i)
+        moves: List[Optional[Direction]] = [None] * len(organisms)
+        for organism_type, indices in members.items():
+            type_organisms = [organisms[i] for i in indices]
+            possible_directions = [self.get_free_directions(organism, organism_cells) for organism in type_organisms]
+            if organism_type.needs_sight:
+                sights = [self.get_sight(organism) for organism in type_organisms]
+            else:
+                sights = [None] * len(type_organisms)
+            type_moves = organism_type.get_moves(type_organisms, possible_directions, sights, self.rng, self.turn)
+            for i, move in zip(indices, type_moves):
+                moves[i] = move
+        for organism, move in zip(organisms, moves):
+            if move is not None:
+                delta_x, delta_y = move.value
+                if self.is_valid_space(organism.x + delta_x, organism.y + delta_y, organism):
+                    self.move_organism(organism, move)
+                else:
+                    organism.cancel_move()
+        # moving is the only thing that uses up food
+        self.aging_schedule.add_starving(organisms)
+
+    # same as get_possible_directions, with organism_cells holding the position of every organism
+    def get_free_directions(self, organism: Entity, organism_cells: Set[Tuple[int, int]]) -> List[Direction]:
+        possible_directions = []
+        for direction in Direction:
+            delta_x, delta_y = direction.value
+            x, y = organism.x + delta_x, organism.y + delta_y
+            if 0 <= x < self.habitat_width and 0 <= y < self.habitat_width and (x, y) not in organism_cells:
+                possible_directions.append(direction)
+        return possible_directions
 
     def get_sight(self, entity: Entity) -> Dict[Direction, list]:
         return_dict = {}
         for direction in Direction:
             return_dict[direction] = self.get_sight_in_direction(entity, direction)
+        if self.instrumentation is not None:
+            self.instrumentation.count('sight_cells_scanned', get_scanned_cell_count(return_dict))
         return return_dict
 
     def get_sight_in_direction(self, entity: Entity, direction: Direction) -> list:
-        count = 0
-        x = entity.x
-        y = entity.y
-        while True:
-            count += 1
-            delta_x, delta_y = direction.value
-            x += delta_x
-            y += delta_y
-            if not 0 <= x < self.habitat_width or not 0 <= y < self.habitat_width:
-                return [count, None]
-            if self.habitat[y][x] != []:
-                return [count, [type(entity) for entity in self.habitat[y][x]]]
+        distance = self.habitat.index.get_distance(entity.x, entity.y, direction)
+        if distance is None:
+            return [self.get_border_distance(entity, direction), None]
+        delta_x, delta_y = direction.value
+        x = entity.x + delta_x * distance
+        y = entity.y + delta_y * distance
+        return [distance, [type(entity) for entity in self.habitat.get_cell(x, y)]]
 
+    # number of steps in direction until entity would be outside of the habitat
+    def get_border_distance(self, entity: Entity, direction: Direction) -> int:
+        if direction == Direction.NORTH:
+            return entity.y + 1
+        if direction == Direction.SOUTH:
+            return self.habitat_width - entity.y
+        if direction == Direction.EAST:
+            return self.habitat_width - entity.x
+        return entity.x + 1
 
     def get_possible_directions(self, organism: RandomOrganism) -> List[Direction]:
         possible_directions = []
@@ -128,41 +251,61 @@ class Simulation:
     def is_valid_space(self, x: int, y: int, organism: RandomOrganism) -> bool:
         if not 0 <= x < self.habitat_width or not 0 <= y < self.habitat_width:
             return False
-        for entity in self.habitat[y][x]:
+        for entity in self.habitat.get_cell(x, y):
             if entity.mask_id == organism.mask_id:
                 return False
         return True
 
-    def get_empty_habitat(self) -> List[List[List]]:
-        return [[[] for _ in range(self.habitat_width)] for _ in range(self.habitat_width)]
+    def get_empty_habitat(self) -> BaseHabitat:
+        if self.config.habitat_backend not in HABITAT_BACKENDS:
+            raise ValueError(f'unknown habitat backend: {self.config.habitat_backend}')
+        habitat_class = HABITAT_BACKENDS[self.config.habitat_backend]
+        return habitat_class(self.habitat_width, track_dirty_cells=self.renderer is not None)
 
     def get_organism(self, x: int, y: int) -> RandomOrganism:
-        chosen_type = choice(self.organism_types)
-        return chosen_type(x, y)
+        chosen_type = self.rng.choice(self.organism_types)
+        return chosen_type(x, y, config=self.config, birth_turn=self.turn)
 
     def is_organism(self, entity: Entity) -> bool:
-        return any([isinstance(entity, o_type) for o_type in self.organism_types])
+        return isinstance(entity, tuple(self.organism_types))
 
     def get_food(self, x: int, y: int) -> Food:
         return Food(x, y)
 
-    def spawn_food(self, spawn_probability: float = 0.5) -> None:
+    def spawn_food(self, spawn_probability: float) -> None:
         self.spawn_entities(spawn_probability, self.get_food)
 
     def spawn_organisms(self) -> None:
-        self.spawn_entities(0.005, self.get_organism)
+        self.spawn_entities(self.config.organism_spawn_probability, self.get_organism)
 
     def spawn_entity(self, entity: Entity, x: int, y: int) -> None:
-        self.habitat[y][x].append(entity)
-        self.entities.append(entity)
+        self.habitat.add(entity, x, y)
+        self.entities.add(entity)
+        if entity.mask_id == constants.ORGANISM_ID:
+            self.aging_schedule.add(entity)
 
     def spawn_entities(self, spawn_probability: float, get_entity_method) -> None:
-        adjusted_spawn_probability = self.get_adjusted_spawn_probability(spawn_probability)
-        for y in range(self.habitat_width):
-            for x in range(self.habitat_width):
-                if self.habitat[y][x] == [] and random() < adjusted_spawn_probability:
-                    new_entity = get_entity_method(x, y)
-                    self.spawn_entity(new_entity, x, y)
+        if self.config.spawn_mode == 'sampled':
+            positions = self.get_sampled_spawn_positions(spawn_probability)
+        elif self.config.spawn_mode == 'per_cell':
+            adjusted_spawn_probability = self.get_adjusted_spawn_probability(spawn_probability)
+            positions = self.habitat.iterate_spawn_positions(adjusted_spawn_probability, self.rng)
+        else:
+            raise ValueError(f'unknown spawn mode: {self.config.spawn_mode}')
+        for x, y in positions:
+            new_entity = get_entity_method(x, y)
+            self.spawn_entity(new_entity, x, y)
+
+    # draws how many entities the per cell rolls would spawn from their binomial distribution and picks that many
+    # distinct empty cells, so the cost depends on the number spawned instead of the size of the habitat. empty cells
+    # are counted by the habitat, so cells holding several entities don't skew the probability the way
+    # get_adjusted_spawn_probability does
+    def get_sampled_spawn_positions(self, spawn_probability: float) -> List[Tuple[int, int]]:
+        empty_count = self.habitat.get_empty_cell_count()
+        if empty_count == 0:
+            return []
+        probability = min(spawn_probability * self.habitat_width ** 2 / empty_count, 1)
+        return self.habitat.sample_empty_cells(get_binomial_count(empty_count, probability, self.rng), self.rng)
 
     # this method adjusts spawn probability based on how many entities there already. for example, if there are 4
     # spaces, and 2 of these contain organisms, and we want food to have a 0.5 spawn probability then the actual
@@ -177,10 +320,24 @@ class Simulation:
         ratio = total_spaces / spaces_available
         return min(spawn_probability * ratio, 1)
 
+    def get_visible_entity(self, x: int, y: int) -> Entity:
+        return max(self.habitat.get_cell(x, y), key=lambda e: e.mask_id)
+
     def get_board_for_renderer(self, default_color: Tuple[int, int, int] = (0, 0, 0)) -> List[List[Tuple[int, int, int]]]:
         board = [[default_color for _ in range(self.habitat_width)] for _ in range(self.habitat_width)]
-        for y in range(self.habitat_width):
-            for x in range(self.habitat_width):
-                if self.habitat[y][x] != []:
-                    board[y][x] = max(self.habitat[y][x], key=lambda e: e.mask_id).color
+        for x, y in self.habitat.occupied_cells:
+            board[y][x] = self.get_visible_entity(x, y).color
         return board
+
+    def get_cell_color(self, x: int, y: int, default_color: Tuple[int, int, int] = (0, 0, 0)) -> Tuple[int, int, int]:
+        if not self.habitat.get_cell(x, y):
+            return default_color
+        return self.get_visible_entity(x, y).color
+
+    # same as get_board_for_renderer, as a habitat_width x habitat_width x 3 array
+    def get_color_array(self, default_color: Tuple[int, int, int] = (0, 0, 0)) -> np.ndarray:
+        colors = np.empty((self.habitat_width, self.habitat_width, 3), dtype=np.uint8)
+        colors[:] = default_color
+        for x, y in self.habitat.occupied_cells:
+            colors[y, x] = self.get_visible_entity(x, y).color
+        return colors
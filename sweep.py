@@ -0,0 +1,112 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from dataclasses import fields
+from functools import partial
+from multiprocessing import Pool
+from typing import Dict, List, Any
+
+from batched_evolution_simulation import BatchedEvolutionSimulation
+from evolution_simulation import EvolutionSimulation
+from config import SimulationConfig, DEFAULT_CONFIG
+
+ENGINES: Dict[str, type] = {'reference': EvolutionSimulation, 'batched': BatchedEvolutionSimulation}
+
+
+# the config of every combination of the values in grid applied to base_config, once for each seed. grid maps
+# SimulationConfig field names to lists of values
+def get_runs(grid: Dict[str, List[Any]], seeds: List[int],
+             base_config: SimulationConfig = DEFAULT_CONFIG) -> List[Dict[str, Any]]:
+    unknown = set(grid) - {field.name for field in fields(SimulationConfig)}
+    if unknown:
+        raise ValueError(f'unknown sweep parameters: {sorted(unknown)}')
+    names = sorted(grid)
+    runs = []
+    for values in itertools.product(*(grid[name] for name in names)):
+        config = base_config.replace(**dict(zip(names, values)))
+        for seed in seeds:
+            runs.append({'config': config.to_dict(), 'seed': seed})
+    return runs
+
+
+def get_run_id(run: Dict[str, Any], engine: str, turns: int) -> str:
+    key = json.dumps({'run': run, 'engine': engine, 'turns': turns}, sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def get_summary(simulation) -> Dict[str, Any]:
+    summary = simulation.get_metric_values()
+    if isinstance(simulation, BatchedEvolutionSimulation):
+        summary['food'] = simulation.habitat.food_total
+    else:
+        summary['food'] = len(simulation.entities) - summary['population']
+    return summary
+
+
+# runs a single simulation in this process and writes its summary to output_dir/<run id>.json, unless that file
+# already exists from an earlier sweep. the file is written under a temporary name and renamed when complete, so an
+# interrupted run never leaves a summary behind
+def run_one(run: Dict[str, Any], engine: str, turns: int, output_dir: str) -> str:
+    run_id = get_run_id(run, engine, turns)
+    path = os.path.join(output_dir, f'{run_id}.json')
+    if os.path.exists(path):
+        return path
+    config = SimulationConfig.from_dict(run['config'])
+    start = time.perf_counter()
+    simulation = ENGINES[engine](config, headless=True, seed=run['seed'])
+    while simulation.turn < turns and simulation.get_metric_values()['population'] > 0:
+        simulation.step()
+    result = {
+        'run_id': run_id,
+        'engine': engine,
+        'config': run['config'],
+        'seed': run['seed'],
+        'turns': turns,
+        'turns_completed': simulation.turn,
+        'elapsed_seconds': time.perf_counter() - start,
+        'summary': get_summary(simulation),
+    }
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'w') as file:
+        json.dump(result, file, indent=2)
+    os.replace(temporary_path, path)
+    return path
+
+
+# runs every combination of grid for every seed on a pool of workers processes, skipping runs that already have a
+# summary in output_dir. returns the paths of all summaries of the sweep
+def run_sweep(grid: Dict[str, List[Any]], seeds: List[int], turns: int, output_dir: str, workers: int,
+              engine: str = 'batched', base_config: SimulationConfig = DEFAULT_CONFIG) -> List[str]:
+    os.makedirs(output_dir, exist_ok=True)
+    runs = get_runs(grid, seeds, base_config)
+    paths = [os.path.join(output_dir, f'{get_run_id(run, engine, turns)}.json') for run in runs]
+    pending = [run for run, path in zip(runs, paths) if not os.path.exists(path)]
+    print(f'{len(runs) - len(pending)} of {len(runs)} runs already done')
+    run = partial(run_one, engine=engine, turns=turns, output_dir=output_dir)
+    with Pool(workers) as pool:
+        for done, path in enumerate(pool.imap_unordered(run, pending), start=1):
+            print(f'{done}/{len(pending)} {path}')
+    return paths
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Run headless EvolutionSimulations over a grid of parameters.')
+    parser.add_argument('grid', help='JSON file mapping SimulationConfig field names to lists of values')
+    parser.add_argument('--config', help='JSON config file with the values that are not swept')
+    parser.add_argument('--output', default='sweep_output', help='directory for the per-run summaries')
+    parser.add_argument('--turns', type=int, default=1000)
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='batched')
+    args = parser.parse_args()
+    with open(args.grid) as file:
+        grid = json.load(file)
+    base_config = DEFAULT_CONFIG if args.config is None else SimulationConfig.from_file(args.config)
+    run_sweep(grid, args.seeds, args.turns, args.output, args.workers, args.engine, base_config)
+
+
+if __name__ == '__main__':
+    main()
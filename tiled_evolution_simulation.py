@@ -0,0 +1,487 @@
+import os
+import weakref
+from multiprocessing import Pool, shared_memory
+from typing import Dict, List, Tuple, Optional, TYPE_CHECKING
+
+import numpy as np
+
+from array_habitat import ArrayHabitat, ORGANISM_FIELDS
+from batched_evolution_simulation import BatchedEvolutionSimulation, DIRECTIONS, DELTAS, get_sight, get_scores, \
+    choose_directions_by_keys, get_scanned_cell_count, take_steps, get_contested, resolve_collisions, age_organisms, \
+    add_offspring, get_reproduction_draws, get_spawn_positions
+from config import SimulationConfig, DEFAULT_CONFIG
+from metrics import MetricsRecorder
+from instrumentation import Instrumentation
+import constants
+
+if TYPE_CHECKING:
+    from checkpoint import Checkpointer
+    from frame_export import FrameExporter
+
+# what a worker needs to attach to a shared array: the name of its memory block, its shape and its dtype
+ArraySpec = Tuple[str, Tuple[int, ...], str]
+# number of tiles unless given. the turns of a seeded run depend on the tiles, so this does not follow the number of
+# workers
+DEFAULT_TILE_COUNT = 8
+# the grids of the habitat, by name, as (dtype, shape of a cell's value). color_grid holds the color of one of the
+# organisms in each cell, where organism_grid is not 0
+GRID_FIELDS: Dict[str, Tuple[type, Tuple[int, ...]]] = {
+    'food_grid': (np.bool_, ()),
+    'organism_grid': (np.int32, ()),
+    'color_grid': (np.uint8, (3,)),
+}
+# the fewest organisms a tile has room for
+MIN_TILE_CAPACITY = 16
+
+
+# a numpy array in a named block of shared memory, created by the main process and attached to by name in the workers
+class SharedArray:
+    def __init__(self, shape: Tuple[int, ...], dtype: type, name: Optional[str] = None) -> None:
+        size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        self.array: np.ndarray = np.ndarray(shape, dtype=dtype, buffer=self.memory.buf)
+
+    @property
+    def spec(self) -> ArraySpec:
+        return self.memory.name, self.array.shape, self.array.dtype.str
+
+    @classmethod
+    def attach(cls, spec: ArraySpec) -> 'SharedArray':
+        name, shape, dtype = spec
+        return cls(shape, np.dtype(dtype), name)
+
+    def close(self, unlink: bool = False) -> None:
+        del self.array
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+
+# arrays a worker process has attached to, by name, so that each block is only mapped once
+ATTACHED_ARRAYS: Dict[str, SharedArray] = {}
+
+
+def attach(spec: ArraySpec) -> np.ndarray:
+    if spec[0] not in ATTACHED_ARRAYS:
+        ATTACHED_ARRAYS[spec[0]] = SharedArray.attach(spec)
+    return ATTACHED_ARRAYS[spec[0]].array
+
+
+# blocks the main process replaced since the last task are no longer needed
+def detach_all_except(names: List[str]) -> None:
+    for name in set(ATTACHED_ARRAYS) - set(names):
+        ATTACHED_ARRAYS.pop(name).close()
+
+
+# the parts of an ArrayHabitat that get_sight reads, over the shared grids. answers exactly like
+# ArrayHabitat.is_occupied and ArrayHabitat.get_visible_colors
+class SharedHabitatView:
+    def __init__(self, width: int, food_grid: np.ndarray, organism_grid: np.ndarray, color_grid: np.ndarray) -> None:
+        self.width: int = width
+        self.food_grid: np.ndarray = food_grid
+        self.organism_grid: np.ndarray = organism_grid
+        self.color_grid: np.ndarray = color_grid
+
+    def is_occupied(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        return self.food_grid[y, x] | (self.organism_grid[y, x] > 0)
+
+    def get_visible_colors(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        colors = np.zeros((len(x), 3), dtype=np.uint8)
+        colors[self.food_grid[y, x]] = constants.GREEN
+        has_organism = self.organism_grid[y, x] > 0
+        colors[has_organism] = self.color_grid[y[has_organism], x[has_organism]]
+        return colors
+
+
+# the first row of each tile, followed by the height of the habitat. row y belongs to tile y * tile_count // width
+def get_tile_rows(width: int, tile_count: int) -> np.ndarray:
+    return -(-np.arange(tile_count + 1) * width // tile_count)
+
+
+# what a worker needs for one phase of a tile's turn: the config, the tile's rows top to bottom (exclusive), the number
+# of organisms in the tile, the state of the tile's generator, the grids it reads and those it writes its rows to, the
+# arrays of its organisms, the names of every shared array that is still in use, and for settle_tile the organisms that
+# moved into the tile and the offspring born into it from another tile (both by field, in global coordinates)
+class TileTask:
+    def __init__(self, config: SimulationConfig, top: int, bottom: int, count: int, rng_state: dict,
+                 read_grid_specs: Dict[str, ArraySpec], write_grid_specs: Dict[str, ArraySpec],
+                 organism_specs: Dict[str, ArraySpec], live_names: List[str],
+                 immigrants: Optional[Dict[str, np.ndarray]] = None,
+                 offspring: Optional[Dict[str, np.ndarray]] = None) -> None:
+        self.config: SimulationConfig = config
+        self.top: int = top
+        self.bottom: int = bottom
+        self.count: int = count
+        self.rng_state: dict = rng_state
+        self.read_grid_specs: Dict[str, ArraySpec] = read_grid_specs
+        self.write_grid_specs: Dict[str, ArraySpec] = write_grid_specs
+        self.organism_specs: Dict[str, ArraySpec] = organism_specs
+        self.live_names: List[str] = live_names
+        self.immigrants: Optional[Dict[str, np.ndarray]] = immigrants
+        self.offspring: Optional[Dict[str, np.ndarray]] = offspring
+
+
+# what a worker hands back for a phase of a tile's turn: the number of organisms now in the tile, the organisms that
+# moved out of it and the offspring born outside of it (both by field, in global coordinates, and empty after
+# settle_tile), the new state of the tile's generator and its instrumentation counts
+class TileResult:
+    def __init__(self, count: int, emigrants: Dict[str, np.ndarray], offspring: Dict[str, np.ndarray],
+                 rng_state: dict, counts: Dict[str, int]) -> None:
+        self.count: int = count
+        self.emigrants: Dict[str, np.ndarray] = emigrants
+        self.offspring: Dict[str, np.ndarray] = offspring
+        self.rng_state: dict = rng_state
+        self.counts: Dict[str, int] = counts
+
+
+# the arrays of a task by name, read grids, write grids and organisms. blocks that are no longer in use are detached
+def attach_task(task: TileTask) -> Tuple[Dict[str, np.ndarray], Dict[str, np.ndarray], Dict[str, np.ndarray]]:
+    detach_all_except(task.live_names)
+    return tuple({name: attach(spec) for name, spec in specs.items()}
+                 for specs in (task.read_grid_specs, task.write_grid_specs, task.organism_specs))
+
+
+def get_empty_fields() -> Dict[str, np.ndarray]:
+    return {name: np.zeros((0,) + shape, dtype=dtype) for name, (dtype, shape) in ORGANISM_FIELDS.items()}
+
+
+# the organisms of a habitat whose row 0 is row offset of the habitat they live in, by field, in global coordinates
+def get_fields(habitat: ArrayHabitat, offset: int, selected: np.ndarray) -> Dict[str, np.ndarray]:
+    fields = {name: getattr(habitat, name)[selected] for name in ORGANISM_FIELDS}
+    fields['y'] = fields['y'] + offset
+    return fields
+
+
+def add_fields(habitat: ArrayHabitat, offset: int, fields: Dict[str, np.ndarray]) -> None:
+    if len(fields['x']) > 0:
+        habitat.add_organisms(fields['x'], fields['y'] - offset,
+                              **{name: fields[name] for name in ORGANISM_FIELDS if name not in ('x', 'y')})
+
+
+# runs in a worker: the first phase of a tile's turn, which follows BatchedEvolutionSimulation with every random number
+# drawn from the tile's generator. directions are chosen from the read grids, as they were at the start of the turn,
+# so the halo a tile reads around its rows is the max(sight, speed) cells its organisms can see or reach. organisms
+# that move out of the tile are handed back before colliding, and the rest of the turn (collisions, aging, food
+# spawning in the tile's rows and reproduction) happens on a habitat of the tile's rows alone, with a row on either side
+# for offspring born across the border. the survivors and the offspring born in the tile's rows replace its organisms,
+# and the tile's rows of food are written to the write grids
+def step_tile(task: TileTask) -> TileResult:
+    read_grids, write_grids, organisms = attach_task(task)
+    config = task.config
+    width = read_grids['food_grid'].shape[1]
+    rng = np.random.default_rng()
+    rng.bit_generator.state = task.rng_state
+    count = task.count
+    own = {name: organisms[name][:count].copy() for name in ORGANISM_FIELDS}
+    own['food_count'] -= config.cost_to_live * own['sight']
+    own['food_count'] -= config.cost_to_live * own['size']
+    is_moving = rng.random(count) >= own['age'] / config.max_age
+    view = SharedHabitatView(width, read_grids['food_grid'], read_grids['organism_grid'], read_grids['color_grid'])
+    distances, colors, seen = get_sight(view, own['x'], own['y'], np.maximum(own['sight'], own['speed']))
+    scores = get_scores(distances, colors, seen, own['sight'], own['is_aggressive'])
+    keys = rng.random((count, len(DIRECTIONS)))
+    directions, move_counts = choose_directions_by_keys(distances, scores, own['sight'], own['speed'], keys)
+    move_counts[~is_moving] = 0
+    steps_taken = take_steps(own['food_count'], move_counts, config.move_cost * own['size'])
+    deltas = DELTAS[np.maximum(directions, 0)] * steps_taken[:, np.newaxis]
+    own['x'] += deltas[:, 0]
+    own['y'] += deltas[:, 1]
+    stays = (task.top <= own['y']) & (own['y'] < task.bottom)
+    emigrants = {name: values[~stays] for name, values in own.items()}
+
+    # local row r is row r + offset of the habitat
+    offset = task.top - 1
+    rows = task.bottom - task.top
+    own_rows = slice(1, rows + 1)
+    habitat = ArrayHabitat(width, max(2 * count, 1), height=rows + 2)
+    food_rows = read_grids['food_grid'][task.top:task.bottom]
+    habitat.food_grid[own_rows] = food_rows
+    habitat.food_total = int(np.count_nonzero(food_rows))
+    add_fields(habitat, offset, {name: values[stays] for name, values in own.items()})
+    eaten_count, keep = resolve_collisions(habitat, get_contested(habitat))
+    deaths = len(keep) - int(np.count_nonzero(keep))
+    keep = age_organisms(habitat, config.max_age)
+    deaths += len(keep) - int(np.count_nonzero(keep))
+    spawn_x, spawn_y = get_spawn_positions(config.spawn_mode, config.food_spawn_probability, habitat.food_grid[own_rows],
+                                           habitat.organism_grid[own_rows], habitat.x, habitat.y - 1,
+                                           habitat.food_total, rng)
+    habitat.add_food(spawn_x, spawn_y + 1)
+    parents = np.flatnonzero(habitat.food_count > config.reproduction_cost)
+    if len(parents) > 0:
+        add_offspring(habitat, parents, get_reproduction_draws(rng, len(parents)),
+                      np.full(len(parents), -offset, dtype=np.int32), config)
+
+    inside = (1 <= habitat.y) & (habitat.y <= rows)
+    kept = get_fields(habitat, offset, inside)
+    kept_count = len(kept['x'])
+    for name in ORGANISM_FIELDS:
+        organisms[name][:kept_count] = kept[name]
+    write_grids['food_grid'][task.top:task.bottom] = habitat.food_grid[own_rows]
+    counts = {'entities_visited': count, 'sight_cells_scanned': get_scanned_cell_count(distances, seen),
+              'collisions': eaten_count, 'deaths': deaths, 'births': len(parents)}
+    return TileResult(kept_count, emigrants, get_fields(habitat, offset, ~inside), rng.bit_generator.state, counts)
+
+
+# runs in a worker: the second phase of a tile's turn, after every tile went through step_tile. the organisms that
+# moved into the tile meet what is in their new cells, age, and reproduce with the tile's generator, their offspring
+# staying in the tile's rows. the offspring born into the tile from another tile come last. the tile's rows of the
+# write grids are then brought up to date with its organisms
+def settle_tile(task: TileTask) -> TileResult:
+    _, grids, organisms = attach_task(task)
+    config = task.config
+    width = grids['food_grid'].shape[1]
+    rng = np.random.default_rng()
+    rng.bit_generator.state = task.rng_state
+    immigrant_count = len(task.immigrants['x'])
+    habitat = ArrayHabitat(width, max(task.count + 2 * immigrant_count + len(task.offspring['x']), 1),
+                           height=task.bottom - task.top)
+    food_rows = grids['food_grid'][task.top:task.bottom]
+    habitat.food_grid[:] = food_rows
+    habitat.food_total = int(np.count_nonzero(food_rows))
+    add_fields(habitat, task.top, {name: organisms[name][:task.count] for name in ORGANISM_FIELDS})
+    add_fields(habitat, task.top, task.immigrants)
+    counts = {'collisions': 0, 'deaths': 0, 'births': 0}
+    if immigrant_count > 0:
+        is_immigrant = np.arange(habitat.population) >= task.count
+        cells = habitat.y * width + habitat.x
+        in_immigrant_cells = np.isin(cells, cells[is_immigrant])
+        contested = np.intersect1d(get_contested(habitat), np.flatnonzero(in_immigrant_cells))
+        counts['collisions'], keep = resolve_collisions(habitat, contested)
+        counts['deaths'] = len(keep) - int(np.count_nonzero(keep))
+        is_immigrant = is_immigrant[keep]
+        keep = age_organisms(habitat, config.max_age, np.flatnonzero(is_immigrant))
+        counts['deaths'] += len(keep) - int(np.count_nonzero(keep))
+        is_immigrant = is_immigrant[keep]
+        parents = np.flatnonzero(is_immigrant & (habitat.food_count > config.reproduction_cost))
+        if len(parents) > 0:
+            add_offspring(habitat, parents, get_reproduction_draws(rng, len(parents)),
+                          np.full(len(parents), -task.top, dtype=np.int32), config)
+        counts['births'] = len(parents)
+    add_fields(habitat, task.top, task.offspring)
+
+    settled = get_fields(habitat, task.top, slice(None))
+    for name in ORGANISM_FIELDS:
+        organisms[name][:habitat.population] = settled[name]
+    grids['food_grid'][task.top:task.bottom] = habitat.food_grid
+    grids['organism_grid'][task.top:task.bottom] = habitat.organism_grid
+    grids['color_grid'][task.top:task.bottom][habitat.y, habitat.x] = habitat.color
+    return TileResult(habitat.population, get_empty_fields(), get_empty_fields(), rng.bit_generator.state, counts)
+
+
+# the worker pool and the shared memory of a TiledEvolutionSimulation. they are kept apart from the simulation so that
+# a finalizer can free them when the simulation is collected, or when the interpreter exits, without close being called
+class TileResources:
+    def __init__(self) -> None:
+        self.pool: Optional[Pool] = None
+        # the grids of the habitat at the start of the turn, and those the tiles write the next turn's grids to
+        self.grids: List[Dict[str, SharedArray]] = []
+        # the organisms of each tile, by field
+        self.organisms: List[Dict[str, SharedArray]] = []
+
+    def get_pool(self, workers: int) -> Pool:
+        if self.pool is None:
+            self.pool = Pool(workers)
+        return self.pool
+
+    def get_live_names(self) -> List[str]:
+        return [shared.memory.name for arrays in self.grids + self.organisms for shared in arrays.values()]
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        # with a single worker the tiles are stepped in this process, which then has the blocks attached as well
+        detach_all_except([])
+        for arrays in self.grids + self.organisms:
+            for shared in arrays.values():
+                shared.close(unlink=True)
+        self.grids = []
+        self.organisms = []
+
+
+# a BatchedEvolutionSimulation that splits the habitat into horizontal strips (tiles) and runs each tile through the
+# turn in a pool of worker processes. the organisms of each tile and the habitat grids live in shared memory, and stay
+# there from turn to turn. a turn has two phases that run the tiles in parallel: step_tile runs each tile's organisms
+# through the turn, and settle_tile takes in the organisms that moved into each tile and the offspring born into it,
+# which this process hands over in tile order. each tile draws from a generator of its own, seeded from the seed, so a
+# seeded run produces the same turns whatever the number of workers. it depends on the number of tiles, and follows the
+# rules of BatchedEvolutionSimulation except for organisms that cross a tile border, which meet what is in their new
+# cell after the rest of the tile's turn.
+# reading habitat gathers the tiles into one ArrayHabitat, which is then what the simulation is, so that it can be
+# changed or replaced like the habitat of a BatchedEvolutionSimulation, and the next turn spreads it over the tiles
+# again. only turns that are rendered, recorded or checkpointed do that work, which grows with the population, in this
+# process. close, or the simulation used as a context manager, stops the workers and frees the shared memory, which
+# otherwise happens when the simulation is collected or the interpreter exits
+class TiledEvolutionSimulation(BatchedEvolutionSimulation):
+    def __init__(self, config: SimulationConfig = DEFAULT_CONFIG, headless: bool = False, render_interval: int = 1,
+                 seed: Optional[int] = None, metrics_recorder: Optional[MetricsRecorder] = None,
+                 checkpointer: Optional['Checkpointer'] = None, instrumentation: Optional[Instrumentation] = None,
+                 frame_exporter: Optional['FrameExporter'] = None, workers: Optional[int] = None,
+                 tile_count: Optional[int] = None) -> None:
+        self.workers: int = workers or os.cpu_count()
+        self.tile_count: int = min(tile_count or DEFAULT_TILE_COUNT, config.habitat_width)
+        # rng only spawns the first organisms and food
+        self.tile_rngs: List[np.random.Generator] = [
+            np.random.default_rng(child) for child in np.random.SeedSequence(seed).spawn(self.tile_count)]
+        self.resources: TileResources = TileResources()
+        self.finalizer: weakref.finalize = weakref.finalize(self, self.resources.close)
+        # the number of organisms in each tile, while the tiles hold the habitat
+        self.tile_populations: List[int] = []
+        # the habitat while it is gathered, None while the tiles hold it
+        self.gathered_habitat: Optional[ArrayHabitat] = None
+        # the results of step_tile for each tile, until the tiles are settled
+        self.tile_results: List[TileResult] = []
+        super().__init__(config, headless, render_interval, seed, metrics_recorder, checkpointer, instrumentation,
+                         frame_exporter)
+
+    @property
+    def habitat(self) -> ArrayHabitat:
+        if self.gathered_habitat is None:
+            self.gathered_habitat = self.gather_tiles()
+        return self.gathered_habitat
+
+    @habitat.setter
+    def habitat(self, habitat: ArrayHabitat) -> None:
+        self.gathered_habitat = habitat
+
+    def __enter__(self) -> 'TiledEvolutionSimulation':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    # the habitat stays readable afterwards
+    def close(self) -> None:
+        if self.finalizer.alive:
+            self.gathered_habitat = self.habitat
+            self.finalizer()
+
+    def do_one_turn(self) -> None:
+        if self.instrumentation is not None:
+            self.do_one_turn_instrumented()
+            return
+        self.step_tiles()
+        self.settle_tiles()
+        self.record_metrics()
+
+    def do_one_turn_instrumented(self) -> None:
+        instrumentation = self.instrumentation
+        instrumentation.start_turn(self.turn)
+        instrumentation.run_phase('step_tiles', self.step_tiles)
+        instrumentation.run_phase('settle_tiles', self.settle_tiles)
+        instrumentation.run_phase('record_metrics', self.record_metrics)
+        instrumentation.end_turn()
+
+    def get_tiles(self, y: np.ndarray) -> np.ndarray:
+        return y.astype(np.int64) * self.tile_count // self.habitat_width
+
+    # runs every tile through step_tile and returns the organisms that left their tile and the offspring born outside
+    # of their parent's tile
+    def step_tiles(self) -> None:
+        if self.gathered_habitat is not None:
+            self.spread_habitat()
+        for tile, population in enumerate(self.tile_populations):
+            self.reserve(tile, 2 * population)
+        read_grids, write_grids = self.resources.grids
+        self.tile_results = self.run_tiles(step_tile, read_grids, write_grids, [{}] * self.tile_count)
+
+    # hands the organisms that left their tile and the offspring born outside of their parent's tile, in tile order, to
+    # the tiles they are in now, and runs every tile through settle_tile. the grids the tiles wrote become the grids of
+    # the habitat
+    def settle_tiles(self) -> None:
+        results, self.tile_results = self.tile_results, []
+        arrivals = [self.split_by_tile([getattr(result, kind) for result in results])
+                    for kind in ('emigrants', 'offspring')]
+        for tile, (immigrants, offspring) in enumerate(zip(*arrivals)):
+            self.reserve(tile, self.tile_populations[tile] + 2 * len(immigrants['x']) + len(offspring['x']))
+        _, grids = self.resources.grids
+        tile_arrivals = [{'immigrants': immigrants, 'offspring': offspring} for immigrants, offspring in zip(*arrivals)]
+        self.run_tiles(settle_tile, grids, grids, tile_arrivals)
+        self.resources.grids.reverse()
+
+    def run_tiles(self, method, read_grids: Dict[str, SharedArray], write_grids: Dict[str, SharedArray],
+                  tile_arguments: List[dict]) -> List[TileResult]:
+        rows = get_tile_rows(self.habitat_width, self.tile_count)
+        live_names = self.resources.get_live_names()
+        read_specs = {name: shared.spec for name, shared in read_grids.items()}
+        write_specs = {name: shared.spec for name, shared in write_grids.items()}
+        tasks = [TileTask(self.config, int(rows[tile]), int(rows[tile + 1]), self.tile_populations[tile],
+                          self.tile_rngs[tile].bit_generator.state, read_specs, write_specs,
+                          {name: shared.spec for name, shared in self.resources.organisms[tile].items()}, live_names,
+                          **arguments)
+                 for tile, arguments in enumerate(tile_arguments)]
+        if self.workers <= 1:
+            results = [method(task) for task in tasks]
+        else:
+            results = self.resources.get_pool(self.workers).map(method, tasks)
+        for tile, result in enumerate(results):
+            self.tile_rngs[tile].bit_generator.state = result.rng_state
+            self.tile_populations[tile] = result.count
+            if self.instrumentation is not None:
+                for name, amount in result.counts.items():
+                    self.instrumentation.count(name, amount)
+        return results
+
+    # the organisms of parts, one after the other, split by the tile they are in
+    def split_by_tile(self, parts: List[Dict[str, np.ndarray]]) -> List[Dict[str, np.ndarray]]:
+        fields = {name: np.concatenate([part[name] for part in parts]) for name in ORGANISM_FIELDS}
+        tiles = self.get_tiles(fields['y'])
+        order = np.argsort(tiles, kind='stable')
+        bounds = np.searchsorted(tiles[order], np.arange(self.tile_count + 1))
+        return [{name: values[order[bounds[tile]:bounds[tile + 1]]] for name, values in fields.items()}
+                for tile in range(self.tile_count)]
+
+    # makes room for capacity organisms in the arrays of the tile, at least doubling them when they grow
+    def reserve(self, tile: int, capacity: int) -> None:
+        arrays = self.resources.organisms[tile]
+        current = len(arrays['x'].array)
+        if capacity <= current:
+            return
+        grown = self.allocate_organisms(max(capacity, 2 * current))
+        population = self.tile_populations[tile]
+        for name, shared in arrays.items():
+            grown[name].array[:population] = shared.array[:population]
+            shared.close(unlink=True)
+        self.resources.organisms[tile] = grown
+
+    def allocate_organisms(self, capacity: int) -> Dict[str, SharedArray]:
+        return {name: SharedArray((max(capacity, MIN_TILE_CAPACITY),) + shape, dtype)
+                for name, (dtype, shape) in ORGANISM_FIELDS.items()}
+
+    # hands the gathered habitat to the tiles, in its current order within each tile
+    def spread_habitat(self) -> None:
+        h = self.gathered_habitat
+        resources = self.resources
+        if not resources.grids:
+            resources.grids = [{name: SharedArray((h.height, h.width) + shape, dtype)
+                                for name, (dtype, shape) in GRID_FIELDS.items()} for _ in range(2)]
+        grids = {name: shared.array for name, shared in resources.grids[0].items()}
+        grids['food_grid'][:] = h.food_grid
+        grids['organism_grid'][:] = h.organism_grid
+        grids['color_grid'][h.y, h.x] = h.color
+        tiles = self.get_tiles(h.y)
+        order = np.argsort(tiles, kind='stable')
+        bounds = np.searchsorted(tiles[order], np.arange(self.tile_count + 1))
+        self.tile_populations = np.diff(bounds).tolist()
+        for arrays in resources.organisms:
+            for shared in arrays.values():
+                shared.close(unlink=True)
+        resources.organisms = [self.allocate_organisms(2 * population) for population in self.tile_populations]
+        for tile, arrays in enumerate(resources.organisms):
+            organisms = order[bounds[tile]:bounds[tile + 1]]
+            for name, shared in arrays.items():
+                shared.array[:len(organisms)] = getattr(h, name)[organisms]
+        self.gathered_habitat = None
+
+    # the organisms of the tiles, in tile order, and the food of the habitat, as one ArrayHabitat
+    def gather_tiles(self) -> ArrayHabitat:
+        resources = self.resources
+        habitat = ArrayHabitat(self.habitat_width, max(sum(self.tile_populations), 1))
+        food_grid = resources.grids[0]['food_grid'].array
+        habitat.food_grid[:] = food_grid
+        habitat.food_total = int(np.count_nonzero(food_grid))
+        organisms = [{name: shared.array[:population] for name, shared in arrays.items()}
+                     for arrays, population in zip(resources.organisms, self.tile_populations)]
+        add_fields(habitat, 0, {name: np.concatenate([tile[name] for tile in organisms]) for name in ORGANISM_FIELDS})
+        return habitat